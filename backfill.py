@@ -0,0 +1,101 @@
+"""
+Date-range backfill for generate.py.
+
+`python generate.py --from 2024-01-01 --to 2024-01-31` schedules every date in
+the range through one bounded thread pool instead of a shell loop of cold
+starts. All workers share transport.py's connection pool and requests-per-minute
+cap, and dates that already have staging output are skipped.
+"""
+
+import datetime
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from colorama import Fore, Style
+
+import transport
+from constants import BACKFILL_CONCURRENCY, HEDGE_MAX_EXTRA_REQUESTS, OPENROUTER_POOL_SIZE
+
+logger = logging.getLogger(__name__)
+
+
+def date_range(start: str, end: str) -> list:
+    """Every "YYYY-MM-DD" from `start` through `end`, inclusive."""
+    first = datetime.date.fromisoformat(start)
+    last = datetime.date.fromisoformat(end)
+    if last < first:
+        raise ValueError(f"--to ({end}) is before --from ({start})")
+    return [(first + datetime.timedelta(days=n)).isoformat() for n in range((last - first).days + 1)]
+
+
+def _run_one(generate_day, the_date, run_args):
+    t1 = time.perf_counter()
+    try:
+        succeeded = generate_day(the_date=the_date, **run_args)
+        error = None
+    except Exception as e:
+        succeeded, error = False, e
+    return succeeded, error, time.perf_counter() - t1
+
+
+def run_backfill(
+    dates: list,
+    generate_day,
+    is_done,
+    concurrency: int = BACKFILL_CONCURRENCY,
+    requests_per_minute: int | None = None,
+    **run_args,
+) -> dict:
+    """
+    Run `generate_day(the_date=..., **run_args)` for each date not yet `is_done(date)`.
+
+    Returns a summary dict with the "generated", "skipped" and "failed" dates and
+    the wall-clock "seconds" the whole backfill took.
+    """
+    t1 = time.perf_counter()
+    summary = {"generated": [], "skipped": [], "failed": [], "seconds": 0.0}
+
+    pending = []
+    for the_date in dates:
+        if is_done(the_date):
+            summary["skipped"].append(the_date)
+        else:
+            pending.append(the_date)
+
+    if summary["skipped"]:
+        logger.info(f"Skipping {len(summary['skipped'])} date(s) already in staging/")
+
+    concurrency = max(1, min(concurrency, len(pending) or 1))
+    # Each day has at most two image requests in flight at once, plus its hedged duplicates
+    transport.configure(
+        pool_size=max(OPENROUTER_POOL_SIZE, concurrency * (2 + HEDGE_MAX_EXTRA_REQUESTS)),
+        requests_per_minute=requests_per_minute,
+    )
+    logger.info(f"Backfilling {len(pending)} date(s), {concurrency} at a time")
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = {executor.submit(_run_one, generate_day, the_date, run_args): the_date for the_date in pending}
+        for done, future in enumerate(as_completed(futures), start=1):
+            the_date = futures[future]
+            succeeded, error, seconds = future.result()
+            if succeeded:
+                summary["generated"].append(the_date)
+                status = f"{Fore.GREEN}done{Style.RESET_ALL}"
+            else:
+                summary["failed"].append(the_date)
+                status = f"{Fore.RED}failed{Style.RESET_ALL}" + (f" ({error})" if error else "")
+            logger.info(f"[{done}/{len(pending)}] {the_date}: {status} [{seconds:.2f} seconds]")
+
+    summary["seconds"] = time.perf_counter() - t1
+    for key in ("generated", "failed"):
+        summary[key].sort()
+
+    logger.info(
+        f"{Fore.CYAN}Backfill complete.{Style.RESET_ALL} "
+        f"{len(summary['generated'])} generated, {len(summary['skipped'])} skipped, "
+        f"{len(summary['failed'])} failed [Total time: {summary['seconds']:.2f} seconds]"
+    )
+    if summary["failed"]:
+        logger.info(f"Failed dates: {', '.join(summary['failed'])}")
+    return summary
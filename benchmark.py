@@ -0,0 +1,357 @@
+"""
+Offline end-to-end benchmark for generate.py and promote.py.
+
+Runs generate.main against two local stand-ins: a fake OpenRouter, which answers
+prompt and image completions with a configurable latency and failure rate, and
+a real SFTP server (asyncssh) that writes uploads to a temporary directory.
+Holidays and silly days are fixed strings, and calendar and news are skipped. A
+whole run (context, prompt, both images, encoding, smaller sizes and upload)
+can then be timed without an API key, a web host or the network. The report
+covers wall time, per-stage time (read from each run's trace), peak memory and
+bytes moved, compared against the numbers stored in benchmark_baseline.json.
+
+    python benchmark.py                     # 3 runs, compared with the baseline
+    python benchmark.py --update-baseline   # store this machine's numbers
+    python benchmark.py --image-latency 2 --failure-rate 0.2 --check
+"""
+
+import argparse
+import asyncio
+import base64
+import glob
+import io
+import json
+import logging
+import os
+import random
+import resource
+import shutil
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+from colorama import Fore, Style
+
+BASELINE_PATH = Path(__file__).parent / "benchmark_baseline.json"
+
+SFTP_USERNAME = "benchmark"
+SFTP_PASSWORD = "benchmark"
+
+# Size of the images the fake hands back, about what a 2K request returns
+IMAGE_DIMENSIONS = {"16:9": (2752, 1536), "9:16": (1536, 2752)}
+
+# Spans from the run's trace that get their own line in the report
+STAGES = ["context", "prompt", "images", "image.portrait", "image.landscape", "save", "derivatives", "upload", "promote"]
+
+
+def _fake_image(size: tuple) -> str:
+    """A noisy gradient, so the PNG (and the WebP made from it) is about as big as real art."""
+    from PIL import Image
+
+    gradient = Image.linear_gradient("L").resize(size)
+    noise = Image.effect_noise(size, 48)
+    image = Image.merge("RGB", (gradient, noise, Image.blend(gradient, noise, 0.5)))
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG", compress_level=1)
+    return f"data:image/png;base64,{base64.b64encode(buffer.getvalue()).decode('ascii')}"
+
+
+class FakeOpenRouter:
+    """
+    /chat/completions on localhost. Requests with "modalities" get an image back
+    after `image_latency` seconds, the rest a prompt after `text_latency`; each
+    fails with a 503 with probability `failure_rate`.
+    """
+
+    def __init__(self, text_latency=0.5, image_latency=1.0, failure_rate=0.0, seed=0):
+        self.text_latency = text_latency
+        self.image_latency = image_latency
+        self.failure_rate = failure_rate
+        self.images = {ratio: _fake_image(size) for ratio, size in IMAGE_DIMENSIONS.items()}
+        self.stats = {"requests": 0, "failures": 0, "bytes_sent": 0}
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = None
+
+    def _respond(self, body: dict) -> tuple:
+        """(status, payload) for one completion request."""
+        is_image = "modalities" in body
+        time.sleep(self.image_latency if is_image else self.text_latency)
+        with self._lock:
+            self.stats["requests"] += 1
+            failed = self._random.random() < self.failure_rate
+            if failed:
+                self.stats["failures"] += 1
+        if failed:
+            return 503, {"error": {"code": 503, "message": "fake upstream overloaded"}}
+
+        if is_image:
+            ratio = body.get("image_config", {}).get("aspect_ratio", "16:9")
+            message = {"content": "", "images": [{"image_url": {"url": self.images[ratio]}}]}
+        else:
+            message = {"content": "A tabby cat conducts an orchestra of teapots on a rooftop at dusk."}
+        return 200, {"choices": [{"message": message}]}
+
+    def start(self) -> str:
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                status, payload = fake._respond(body)
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                try:
+                    self.wfile.write(data)
+                except (BrokenPipeError, ConnectionResetError):
+                    # A hedged request that lost the race hangs up mid-body
+                    return
+                with fake._lock:
+                    fake.stats["bytes_sent"] += len(data)
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=self._server.serve_forever, name="fake-openrouter", daemon=True).start()
+        return f"http://127.0.0.1:{self._server.server_port}"
+
+
+class LocalSFTP:
+    """An SFTP server on localhost, chrooted to `root`, on its own event loop thread."""
+
+    def __init__(self, root: str):
+        self.root = root
+        self.stats = {"connections": 0}
+        self._loop = asyncio.new_event_loop()
+
+    async def _listen(self):
+        import asyncssh
+
+        stats = self.stats
+
+        class Server(asyncssh.SSHServer):
+            def connection_made(self, conn):
+                stats["connections"] += 1
+
+            def password_auth_supported(self):
+                return True
+
+            def validate_password(self, username, password):
+                return (username, password) == (SFTP_USERNAME, SFTP_PASSWORD)
+
+        root = self.root.encode("utf-8")
+        return await asyncssh.listen(
+            "127.0.0.1",
+            0,
+            server_host_keys=[asyncssh.generate_private_key("ssh-ed25519")],
+            server_factory=Server,
+            sftp_factory=lambda chan: asyncssh.SFTPServer(chan, chroot=root),
+        )
+
+    def start(self) -> int:
+        threading.Thread(target=self._loop.run_forever, name="local-sftp", daemon=True).start()
+        listener = asyncio.run_coroutine_threadsafe(self._listen(), self._loop).result()
+        return listener.get_port()
+
+    def bytes_stored(self) -> int:
+        return sum(path.stat().st_size for path in Path(self.root).rglob("*") if path.is_file())
+
+
+def _stage_seconds(trace_path: str) -> dict:
+    """Wall-clock seconds spent in each of STAGES, counting overlapping spans with that name once."""
+    import tracing  # only once run_benchmark has set the environment constants.py reads
+
+    with open(trace_path) as f:
+        events = json.load(f)["traceEvents"]
+    by_stage = {}
+    for event in events:
+        if event.get("ph") == "X" and event["name"] in STAGES:
+            by_stage.setdefault(event["name"], []).append(event)
+    return {name: tracing.wall_seconds(stage_events) for name, stage_events in by_stage.items()}
+
+
+def run_benchmark(args) -> dict:
+    """Start the stand-ins, drive generate.main `args.runs` times and return the median of each metric."""
+    workdir = tempfile.mkdtemp(prefix="aicalart-benchmark-")
+    sftp_root = os.path.join(workdir, "remote")
+    os.makedirs(sftp_root)
+
+    print(f"Rendering fake images and starting the stand-ins in {workdir}...")
+    openrouter = FakeOpenRouter(args.text_latency, args.image_latency, args.failure_rate, args.seed)
+    sftp = LocalSFTP(sftp_root)
+
+    # constants.py reads these on import, so they have to be set before generate is imported
+    os.environ.update(
+        {
+            "OPENROUTER_BASE_URL": openrouter.start(),
+            "OPENROUTER_AICALART_API_KEY": "benchmark",
+            "AICALART_SERVER": "127.0.0.1",
+            "AICALART_PORT": str(sftp.start()),
+            "AICALART_USERNAME": SFTP_USERNAME,
+            "AICALART_PASSWORD": SFTP_PASSWORD,
+            "AICALART_IMAGES_PATH": "/images",
+            "AICALART_PROMPTS_PATH": "/prompts",
+            "TRACING": "1",
+        }
+    )
+    os.chdir(workdir)
+    import generate
+    import hedge
+    import hosting
+    import ledger
+    import remote_manifest
+
+    # Keep the fake's latencies out of the real hedging history and run ledger
+    hedge.STATS_PATH = Path(workdir) / "hedging.json"
+    ledger.LEDGER_PATH = Path(workdir) / "ledger.sqlite3"
+    remote_manifest.MANIFEST_PATH = Path(workdir) / "remote_manifest.json"
+    # Stand in for the holiday and silly-day lookups too. The holidays package's cold start
+    # takes anywhere from a tenth of a second to a couple of seconds, and none of it is this code's
+    generate.get_holiday = lambda the_date: "Benchmark Day"
+    generate.get_silly_day = lambda the_date: "National Stand-In Day"
+
+    # asyncssh logs every channel open and close at INFO, on both ends
+    logging.getLogger("asyncssh").setLevel(logging.WARNING)
+
+    runs = []
+    try:
+        for run in range(args.runs):
+            shutil.rmtree("staging", ignore_errors=True)
+            shutil.rmtree(sftp_root, ignore_errors=True)
+            os.makedirs(sftp_root)
+            # The host starts empty each run, so nothing on it is unchanged
+            remote_manifest.MANIFEST_PATH.unlink(missing_ok=True)
+            sent_before = openrouter.stats["bytes_sent"]
+            requests_before = openrouter.stats["requests"]
+
+            tracemalloc.start()
+            t1 = time.perf_counter()
+            succeeded = generate.main(
+                the_date=args.date,
+                style="Benchmark watercolor",
+                skip_calendar=True,
+                skip_news=True,
+                skip_upload=args.skip_upload,
+                prompt_cache_enabled=False,
+                hedge=args.hedge,
+            )
+            wall = time.perf_counter() - t1
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            # Each run starts cold, as a cron-launched generate.py would (the daemon keeps it open)
+            hosting.get_manager().close()
+
+            traces = glob.glob("staging/trace-*.json")
+            runs.append(
+                {
+                    "succeeded": bool(succeeded),
+                    "wall_seconds": wall,
+                    "stages": _stage_seconds(traces[0]) if traces else {},
+                    "peak_python_mib": peak / (1 << 20),
+                    "openrouter_requests": openrouter.stats["requests"] - requests_before,
+                    "downloaded_mib": (openrouter.stats["bytes_sent"] - sent_before) / (1 << 20),
+                    "staged_mib": sum(os.path.getsize(p) for p in glob.glob("staging/*.webp")) / (1 << 20),
+                    "uploaded_mib": sftp.bytes_stored() / (1 << 20),
+                }
+            )
+            status = "ok" if succeeded else f"{Fore.RED}failed{Style.RESET_ALL}"
+            print(f"Run {run + 1}/{args.runs}: {status} [{wall:.2f} seconds]")
+    finally:
+        os.chdir(Path(__file__).parent)
+        if not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    def median(key):
+        return statistics.median(run[key] for run in runs)
+
+    stage_names = [name for name in STAGES if any(name in run["stages"] for run in runs)]
+    metrics = {
+        "wall_seconds": median("wall_seconds"),
+        **{f"stage.{name}_seconds": statistics.median(run["stages"].get(name, 0.0) for run in runs) for name in stage_names},
+        "peak_python_mib": median("peak_python_mib"),
+        # High-water mark of the whole process, so it only ever grows across runs
+        "peak_rss_mib": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "openrouter_requests": median("openrouter_requests"),
+        "downloaded_mib": median("downloaded_mib"),
+        "staged_mib": median("staged_mib"),
+        "uploaded_mib": median("uploaded_mib"),
+        "sftp_connections_per_run": sftp.stats["connections"] / max(len(runs), 1),
+    }
+    return {
+        "config": {
+            "text_latency": args.text_latency,
+            "image_latency": args.image_latency,
+            "failure_rate": args.failure_rate,
+            "skip_upload": args.skip_upload,
+            "hedge": args.hedge,
+        },
+        "runs": len(runs),
+        "failed_runs": sum(not run["succeeded"] for run in runs),
+        "metrics": {name: round(value, 3) for name, value in metrics.items()},
+    }
+
+
+def compare(result: dict, baseline: dict | None, tolerance: float) -> list:
+    """Print the report; returns the metrics that got worse than the baseline by more than `tolerance`."""
+    regressions = []
+    base_metrics = (baseline or {}).get("metrics", {})
+    if baseline and baseline.get("config") != result["config"]:
+        print(f"{Fore.YELLOW}Baseline was recorded with {baseline.get('config')}; comparing anyway.{Style.RESET_ALL}")
+
+    print(f"\n{'metric':<32}{'this run':>12}{'baseline':>12}{'change':>10}")
+    for name, value in result["metrics"].items():
+        base = base_metrics.get(name)
+        if base is None:
+            print(f"{name:<32}{value:>12.2f}{'-':>12}{'':>10}")
+            continue
+        change = (value - base) / base if base else 0.0
+        # Small absolute differences in tiny stages are noise, not regressions
+        worse = change > tolerance and abs(value - base) > 0.05
+        colour = Fore.RED if worse else (Fore.GREEN if change < -tolerance else "")
+        print(f"{name:<32}{value:>12.2f}{base:>12.2f}{colour}{change:>+10.0%}{Style.RESET_ALL}")
+        if worse:
+            regressions.append(name)
+
+    print(f"\n{result['runs']} run(s), {result['failed_runs']} failed")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark a full generate + promote run against local stand-ins.")
+    parser.add_argument("--runs", type=int, default=3, help="How many runs to take the median of (default: 3).")
+    parser.add_argument("--date", default="2024-07-04", help="Date to generate (default: 2024-07-04).")
+    parser.add_argument("--text-latency", type=float, default=0.5, help="Seconds the fake takes to write a prompt.")
+    parser.add_argument("--image-latency", type=float, default=1.0, help="Seconds the fake takes to return an image.")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Chance (0-1) of a fake 503 per request.")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the fake's failures and images.")
+    parser.add_argument("--hedge", action="store_true", help="Run with hedged image requests.")
+    parser.add_argument("--skip-upload", action="store_true", help="Leave out the SFTP upload.")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Slowdown counted as a regression (default: 0.2).")
+    parser.add_argument("--update-baseline", action="store_true", help=f"Save these numbers to {BASELINE_PATH.name}.")
+    parser.add_argument("--check", action="store_true", help="Exit with status 1 on a regression or a failed run.")
+    parser.add_argument("--keep", action="store_true", help="Keep the temporary working directory.")
+    args = parser.parse_args()
+
+    result = run_benchmark(args)
+    baseline = json.loads(BASELINE_PATH.read_text()) if BASELINE_PATH.exists() else None
+    regressions = compare(result, baseline, args.tolerance)
+
+    if args.update_baseline:
+        BASELINE_PATH.write_text(json.dumps(result, indent=4) + "\n")
+        print(f"Baseline saved to {BASELINE_PATH}")
+    elif regressions:
+        print(f"{Fore.RED}Slower or bigger than the baseline: {', '.join(regressions)}{Style.RESET_ALL}")
+
+    if args.check and (regressions or result["failed_runs"]):
+        sys.exit(1)
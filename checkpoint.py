@@ -0,0 +1,105 @@
+"""
+Per-run checkpoints, so an interrupted generate.py can pick up where it stopped.
+
+Each stage of a run writes what it produced to staging/checkpoints/<date>/ as
+soon as it has it: the run's stamp and style, the gathered context, each
+fallback level's prompt, each orientation's image data, each saved WebP and
+each finished upload. Every file is written to a temporary name and renamed
+into place, so a checkpoint is either whole or missing.
+
+`generate.py --resume` then skips every stage whose checkpoint is there and
+still valid (an image's style matches, a WebP on disk still has the size it
+was saved with, and so on). A run that finishes discards its checkpoints; one
+that starts without --resume clears any left over for its date.
+"""
+
+import json
+import logging
+import os
+import shutil
+import threading
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_DIR = Path("./staging/checkpoints")
+
+
+class Checkpoint:
+    """The checkpoint directory for one date's run."""
+
+    def __init__(self, the_date: str, resume: bool = False, root: Path | None = None):
+        self.path = Path(root or CHECKPOINT_DIR) / the_date
+        if not resume and self.path.exists():
+            shutil.rmtree(self.path, ignore_errors=True)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+
+    def load(self, stage: str, validate=None) -> dict | None:
+        """A stage's saved output, or None if it's missing, unreadable or fails `validate`."""
+        try:
+            with open(self.path / f"{stage}.json") as f:
+                data = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError, IOError):
+            return None
+        if validate is not None and not validate(data):
+            logger.info(f"Ignoring stale checkpoint '{stage}'")
+            return None
+        return data
+
+    def _write(self, path: Path, write) -> None:
+        tmp_path = path.with_name(f"{path.name}.{threading.get_ident()}.tmp")
+        with open(tmp_path, "w") as f:
+            write(f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+
+    def save(self, stage: str, data: dict, text: str | None = None) -> None:
+        """
+        Save a stage's output. Bulky `text` (an image's data URL) goes in a file
+        of its own, so it isn't copied again by JSON encoding; it's written first,
+        so the stage only counts once both are there.
+        """
+        if text is not None:
+            self._write(self.path / f"{stage}.txt", lambda f: f.write(text))
+        self._write(self.path / f"{stage}.json", lambda f: json.dump(data, f))
+
+    def load_text(self, stage: str) -> str | None:
+        try:
+            with open(self.path / f"{stage}.txt") as f:
+                return f.read()
+        except (FileNotFoundError, IOError):
+            return None
+
+    def update(self, stage: str, key: str, value) -> None:
+        """Set one entry of a dict-shaped stage, such as one file of the uploads."""
+        with self._lock:
+            data = self.load(stage) or {}
+            data[key] = value
+            self.save(stage, data)
+
+    def forget(self, stage: str) -> None:
+        """Remove a stage's checkpoint, so a resumed run does that stage again."""
+        for suffix in (".json", ".txt"):
+            (self.path / f"{stage}{suffix}").unlink(missing_ok=True)
+
+    def prompt_levels(self) -> list:
+        """Fallback levels that have a saved prompt, lowest first."""
+        levels = []
+        for path in self.path.glob("prompt-*.json"):
+            suffix = path.stem.split("-", 1)[1]
+            if suffix.isdigit():
+                levels.append(int(suffix))
+        return sorted(levels)
+
+    def discard(self) -> None:
+        shutil.rmtree(self.path, ignore_errors=True)
+
+
+def file_unchanged(path: str, size: int) -> bool:
+    """True if `path` exists with the size it was checkpointed with."""
+    try:
+        return os.path.getsize(path) == size
+    except OSError:
+        return False
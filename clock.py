@@ -0,0 +1,42 @@
+"""
+Dates and times in the calendar's own timezone.
+
+"Today" is the date in AICALART_TIMEZONE (America/Chicago by default), not the
+date wherever the script happens to run, and a day's calendar events are the
+ones between its local midnights. Staging timestamps stay in UTC.
+"""
+
+import datetime
+from zoneinfo import ZoneInfo
+
+from constants import AICALART_TIMEZONE
+
+TIMEZONE = ZoneInfo(AICALART_TIMEZONE)
+
+
+def now() -> datetime.datetime:
+    """The current time in TIMEZONE."""
+    return datetime.datetime.now(TIMEZONE)
+
+
+def today() -> str:
+    """Today's date in TIMEZONE, e.g. "2023-11-25"."""
+    return now().date().isoformat()
+
+
+def utc_timestamp() -> str:
+    """The current UTC time as staging files spell it, e.g. "2023-11-25T06:43:27.521185+00:00Z"."""
+    return f"{datetime.datetime.now(datetime.timezone.utc).isoformat()}Z"
+
+
+def _rfc3339_utc(when: datetime.datetime) -> str:
+    return when.astimezone(datetime.timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+
+
+def day_bounds_utc(the_date: str) -> tuple:
+    """UTC RFC 3339 strings for the local midnight that starts `the_date` and the one that ends it."""
+    day = datetime.date.fromisoformat(the_date)
+    start = datetime.datetime.combine(day, datetime.time(), TIMEZONE)
+    # Combining with the next date (rather than adding 24 hours) keeps DST days right
+    end = datetime.datetime.combine(day + datetime.timedelta(days=1), datetime.time(), TIMEZONE)
+    return _rfc3339_utc(start), _rfc3339_utc(end)
@@ -8,22 +8,128 @@ load_dotenv()
 AICALART_SFTP_SERVER = os.getenv("AICALART_SERVER")
 AICALART_SFTP_USERNAME = os.getenv("AICALART_USERNAME")
 AICALART_SFTP_PASSWORD = os.getenv("AICALART_PASSWORD")
+AICALART_SFTP_PORT = int(os.getenv("AICALART_PORT", "22"))
+# Seconds between SSH keepalives on the shared connection (see hosting.py); 0 = none
+SFTP_KEEPALIVE_INTERVAL = float(os.getenv("SFTP_KEEPALIVE_INTERVAL", "30"))
+# Files promote.py uploads at once over the shared session
+SFTP_CONCURRENT_UPLOADS = int(os.getenv("SFTP_CONCURRENT_UPLOADS", "4"))
+# Bytes per SFTP write and writes in flight per file; -1 = asyncssh's choice from the server's limits
+SFTP_BLOCK_SIZE = int(os.getenv("SFTP_BLOCK_SIZE", "-1"))
+SFTP_MAX_REQUESTS = int(os.getenv("SFTP_MAX_REQUESTS", "-1"))
+# Read each upload back and compare its SHA-256 before renaming it into place; 0 = check its size only
+SFTP_VERIFY_UPLOADS = os.getenv("SFTP_VERIFY_UPLOADS", "1") != "0"
 AICALART_BASE_URL = os.getenv("AICALART_BASE_URL")
 AICALART_IMAGES_PATH = os.getenv("AICALART_IMAGES_PATH")
 AICALART_PROMPTS_PATH = os.getenv("AICALART_PROMPTS_PATH")
 
+# The calendar's timezone: decides what "today" is and when the daemon runs
+AICALART_TIMEZONE = os.getenv("AICALART_TIMEZONE", "America/Chicago")
+
 ### Image settings
 OPENROUTER_AICALART_API_KEY = os.getenv("OPENROUTER_AICALART_API_KEY")
-OPENROUTER_BASE_URL = "https://openrouter.ai/api/v1"
+OPENROUTER_BASE_URL = os.getenv("OPENROUTER_BASE_URL", "https://openrouter.ai/api/v1")
 GPT_MODEL = "google/gemini-2.5-flash"
 IMAGE_MODEL = 'google/gemini-3-pro-image-preview'  # Nano Banana Pro
 PORTRAIT_ASPECT_RATIO = '9:16'
 LANDSCAPE_ASPECT_RATIO = '16:9'
 IMAGE_SIZE = '2K'
+# Smaller copies of each image for smaller screens, by width in pixels (the full
+# size is always kept); encoded by IMAGE_DERIVATIVE_WORKERS processes
+IMAGE_DERIVATIVE_WIDTHS = [
+    int(width) for width in os.getenv("IMAGE_DERIVATIVE_WIDTHS", "640,1280").split(",") if width.strip()
+]
+# Width of the tiny, blurred stand-in the site paints while the real image loads
+IMAGE_PLACEHOLDER_WIDTH = int(os.getenv("IMAGE_PLACEHOLDER_WIDTH", "32"))
+IMAGE_DERIVATIVE_WORKERS = int(os.getenv("IMAGE_DERIVATIVE_WORKERS", str(min(os.cpu_count() or 1, 4))))
+
+# Shared OpenRouter connection pool (see transport.py). Both orientations go out
+# at once alongside the prompt call, so a handful of connections is plenty.
+OPENROUTER_POOL_SIZE = int(os.getenv("OPENROUTER_POOL_SIZE", "4"))
+OPENROUTER_CONNECT_TIMEOUT = float(os.getenv("OPENROUTER_CONNECT_TIMEOUT", "10"))
+OPENROUTER_READ_TIMEOUT = float(os.getenv("OPENROUTER_READ_TIMEOUT", "150"))
+# Requests per minute across every thread in the process; 0 means no cap
+OPENROUTER_REQUESTS_PER_MINUTE = int(os.getenv("OPENROUTER_REQUESTS_PER_MINUTE", "0"))
+
+### Hedged image requests (see hedge.py); off unless IMAGE_HEDGING=1 or --hedge
+IMAGE_HEDGING = os.getenv("IMAGE_HEDGING", "0") == "1"
+# Send a duplicate once a request has taken longer than this percentile of recent ones
+HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", "90"))
+# Until there are HEDGE_MIN_SAMPLES latencies on record, wait this many seconds instead
+HEDGE_DEFAULT_DELAY = float(os.getenv("HEDGE_DEFAULT_DELAY", "90"))
+HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", "5"))
+# Most duplicate image requests (each one billed) a single run may send
+HEDGE_MAX_EXTRA_REQUESTS = int(os.getenv("HEDGE_MAX_EXTRA_REQUESTS", "1"))
+
+### Context sources, gathered in parallel by generate.py; seconds each may take
+# before the run carries on without it
+CONTEXT_SOURCE_TIMEOUTS = {
+    "holiday": float(os.getenv("HOLIDAY_TIMEOUT", "10")),
+    "silly_day": float(os.getenv("SILLY_DAY_TIMEOUT", "10")),
+    "news": float(os.getenv("NEWS_TIMEOUT", "20")),
+    "calendar": float(os.getenv("CALENDAR_TIMEOUT", "30")),
+}
+
+### News headlines (see news.py)
+# Comma-separated Google News feeds, each a country code with an optional topic,
+# e.g. "US,US:WORLD,GB"; the top headline across them is used
+NEWS_FEEDS = [feed.strip() for feed in os.getenv("NEWS_FEEDS", "US").split(",") if feed.strip()]
+NEWS_PERIOD = os.getenv("NEWS_PERIOD", "1h")
+# Seconds to wait for the feeds before falling back to the last headlines fetched
+NEWS_DEADLINE = float(os.getenv("NEWS_DEADLINE", "5"))
+# Seconds fetched headlines count as fresh
+NEWS_CACHE_TTL = float(os.getenv("NEWS_CACHE_TTL", str(15 * 60)))
+
+### Daemon (see daemon.py)
+# Local time (in AICALART_TIMEZONE) each day's art is made
+DAEMON_RUN_AT = os.getenv("DAEMON_RUN_AT", "00:00")
+# Hours before DAEMON_RUN_AT to make the next day and upload it hidden; 0 = make it at DAEMON_RUN_AT
+DAEMON_AHEAD_HOURS = float(os.getenv("DAEMON_AHEAD_HOURS", "0"))
+# Health/status endpoint; port 0 turns it off
+DAEMON_STATUS_HOST = os.getenv("DAEMON_STATUS_HOST", "127.0.0.1")
+DAEMON_STATUS_PORT = int(os.getenv("DAEMON_STATUS_PORT", "8787"))
+# After downtime, missed days up to this many back are made on restart
+DAEMON_CATCH_UP_DAYS = int(os.getenv("DAEMON_CATCH_UP_DAYS", "7"))
+# Seconds before a failed day is tried again
+DAEMON_RETRY_INTERVAL = float(os.getenv("DAEMON_RETRY_INTERVAL", "900"))
+# Seconds before a run to refresh credentials and open connections
+DAEMON_WARMUP_SECONDS = float(os.getenv("DAEMON_WARMUP_SECONDS", "120"))
+
+### Tracing (see tracing.py); set to 0 to stop writing staging/trace-*.json
+TRACING = os.getenv("TRACING", "1") != "0"
+
+### Prompt cache (see prompt_cache.py)
+PROMPT_CACHE_TTL = float(os.getenv("PROMPT_CACHE_TTL", str(7 * 24 * 60 * 60)))  # seconds
+PROMPT_CACHE_MAX_BYTES = int(os.getenv("PROMPT_CACHE_MAX_BYTES", str(5 * 1024 * 1024)))
+
+### Backfill (generate.py --from/--to)
+BACKFILL_CONCURRENCY = int(os.getenv("BACKFILL_CONCURRENCY", "2"))
 
 ### Google Calendar
 GOOGLE_CALENDAR_ID = os.getenv("GOOGLE_CALENDAR_ID")
+# Comma-separated calendar IDs to pull events from, or "all" for every calendar
+# on the account; defaults to just GOOGLE_CALENDAR_ID
+GOOGLE_CALENDAR_IDS = [
+    calendar_id.strip()
+    for calendar_id in os.getenv("GOOGLE_CALENDAR_IDS", GOOGLE_CALENDAR_ID or "").split(",")
+    if calendar_id.strip()
+]
+# Most events (across all calendars) that make it into the prompt
+GOOGLE_CALENDAR_MAX_EVENTS = int(os.getenv("GOOGLE_CALENDAR_MAX_EVENTS", "3"))
+# Read events from a local store kept current with incremental sync (see
+# event_store.py) instead of querying each day live; set to 0 to query live
+GOOGLE_CALENDAR_SYNC = os.getenv("GOOGLE_CALENDAR_SYNC", "1") != "0"
+# Seconds a calendar counts as fresh after a sync, so a backfill syncs it once
+GOOGLE_CALENDAR_SYNC_INTERVAL = float(os.getenv("GOOGLE_CALENDAR_SYNC_INTERVAL", "300"))
 SCOPES = ["https://www.googleapis.com/auth/calendar.readonly"]
+# Refresh the OAuth token this many seconds before it actually expires
+GOOGLE_TOKEN_REFRESH_MARGIN = float(os.getenv("GOOGLE_TOKEN_REFRESH_MARGIN", "300"))
+# Unset uses the discovery document bundled with google-api-python-client. Point
+# it at another server (e.g. a local stand-in) and the fetched document is
+# cached on disk for GOOGLE_DISCOVERY_CACHE_TTL seconds.
+GOOGLE_DISCOVERY_URL = os.getenv("GOOGLE_DISCOVERY_URL")
+# Likewise for the OAuth token endpoint; unset means Google's own
+GOOGLE_TOKEN_URI = os.getenv("GOOGLE_TOKEN_URI")
+GOOGLE_DISCOVERY_CACHE_TTL = float(os.getenv("GOOGLE_DISCOVERY_CACHE_TTL", str(24 * 60 * 60)))
 
 ### Prompt styles
 # You can change this to what you want in .env via `ALWAYS_INCLUDE_IN_PROMPT`
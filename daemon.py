@@ -0,0 +1,374 @@
+"""
+Long-running scheduler that replaces the cron-launched generate.py.
+
+`python daemon.py` stays resident and makes each day's art at DAEMON_RUN_AT in
+AICALART_TIMEZONE. Because the process stays up, the imports, the pooled
+OpenRouter session, the SFTP connection (see hosting.py), the Google
+credentials and the Calendar service outlive a single run. Shortly before each run they are warmed: credentials refreshed if
+needed and a connection opened.
+
+Every finished day is recorded in cache/daemon_state.json. On start, and
+after each run, any due day that hasn't been made yet is made, going back up
+to DAEMON_CATCH_UP_DAYS. Missed runs after downtime therefore catch up on
+their own, and a failed day is retried every DAEMON_RETRY_INTERVAL seconds.
+
+With DAEMON_AHEAD_HOURS (or --ahead), tomorrow's art is made that many hours
+early and uploaded under hidden names. At the cutover it's put live by
+promote.publish(), renaming the files into place with the prompt JSON last, so
+visitors never wait on generation. If the early run never succeeded, the
+cutover falls back to making the day then.
+
+GET /health on DAEMON_STATUS_PORT answers 200 while the latest due day is done
+(or being made) and 503 when it isn't. GET /status returns the schedule, recent
+runs and connection stats as JSON.
+"""
+
+import argparse
+import asyncio
+import datetime
+import json
+import logging
+import os
+import signal
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+from colorama import Fore, Style
+
+import clock
+import generate
+import hosting
+import promote
+import transport
+from constants import (
+    AICALART_TIMEZONE,
+    DAEMON_AHEAD_HOURS,
+    DAEMON_CATCH_UP_DAYS,
+    DAEMON_RETRY_INTERVAL,
+    DAEMON_RUN_AT,
+    DAEMON_STATUS_HOST,
+    DAEMON_STATUS_PORT,
+    DAEMON_WARMUP_SECONDS,
+    OPENROUTER_BASE_URL,
+)
+
+logger = logging.getLogger(__name__)
+
+STATE_PATH = Path(__file__).parent / "cache" / "daemon_state.json"
+
+# Days of history kept in the state file
+STATE_HISTORY_DAYS = 60
+# Shortest sleep between passes of run_forever
+MIN_WAIT_SECONDS = 1.0
+
+
+def parse_run_at(value: str) -> datetime.time:
+    hour, minute = value.split(":")
+    return datetime.time(int(hour), int(minute))
+
+
+class Scheduler:
+    """Works out which days are due and keeps a record of how each one went."""
+
+    def __init__(
+        self,
+        run_at: datetime.time,
+        ahead_hours: float = DAEMON_AHEAD_HOURS,
+        catch_up_days: int = DAEMON_CATCH_UP_DAYS,
+        state_path: Path = STATE_PATH,
+    ):
+        self.run_at = run_at
+        self.ahead = datetime.timedelta(hours=ahead_hours)
+        self.catch_up_days = catch_up_days
+        self.state_path = state_path
+        self.state = self._load()
+        self.running = None
+        self.started_at = clock.now()
+        self._lock = threading.Lock()
+
+    def _load(self) -> dict:
+        try:
+            with open(self.state_path) as f:
+                state = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError, IOError):
+            state = {}
+        state.setdefault("completed", {})
+        state.setdefault("staged", {})
+        state.setdefault("failed", {})
+        return state
+
+    def _save(self) -> None:
+        cutoff = (clock.now().date() - datetime.timedelta(days=STATE_HISTORY_DAYS)).isoformat()
+        for key in ("completed", "staged", "failed"):
+            self.state[key] = {day: info for day, info in self.state[key].items() if day >= cutoff}
+        self.state_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.state_path.with_suffix(".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(self.state, f, indent=4)
+        os.replace(tmp_path, self.state_path)
+
+    def run_time(self, day: datetime.date) -> datetime.datetime:
+        return datetime.datetime.combine(day, self.run_at, clock.TIMEZONE)
+
+    def latest_due(self, now: datetime.datetime) -> datetime.date:
+        """The most recent day whose run time has passed."""
+        today = now.date()
+        return today if now >= self.run_time(today) else today - datetime.timedelta(days=1)
+
+    def next_run(self, now: datetime.datetime) -> datetime.datetime:
+        return self.run_time(self.latest_due(now) + datetime.timedelta(days=1))
+
+    def _first_due(self, latest: datetime.date) -> datetime.date:
+        """The oldest day still caught up on; call with the lock held."""
+        # A fresh install starts with today instead of a week of backfill
+        since = self.state.setdefault("since", latest.isoformat())
+        return max(latest - datetime.timedelta(days=self.catch_up_days - 1), datetime.date.fromisoformat(since))
+
+    def due_days(self, now: datetime.datetime) -> list:
+        """Days not made yet (oldest first) whose time has come, skipping failures still waiting out their retry."""
+        with self._lock:
+            latest = self.latest_due(now)
+            first = self._first_due(latest)
+            due = []
+            for offset in range((latest - first).days + 1):
+                day = (first + datetime.timedelta(days=offset)).isoformat()
+                if day not in self.state["completed"] and not self._waiting_to_retry(day):
+                    due.append(day)
+            return due
+
+    def _waiting_to_retry(self, day: str) -> bool:
+        failed = self.state["failed"].get(day)
+        return bool(failed) and time.time() - failed["at"] < DAEMON_RETRY_INTERVAL
+
+    def stage_at(self, now: datetime.datetime) -> datetime.datetime | None:
+        """When the next day should be made ahead of time, if it still needs to be."""
+        if not self.ahead:
+            return None
+        day = self.latest_due(now) + datetime.timedelta(days=1)
+        with self._lock:
+            if day.isoformat() in self.state["staged"] or day.isoformat() in self.state["completed"]:
+                return None
+        return self.run_time(day) - self.ahead
+
+    def day_to_stage(self, now: datetime.datetime) -> str | None:
+        """The next day, if it's time to make it ahead of its cutover."""
+        stage_at = self.stage_at(now)
+        if stage_at is None or now < stage_at:
+            return None
+        day = (self.latest_due(now) + datetime.timedelta(days=1)).isoformat()
+        with self._lock:
+            return None if self._waiting_to_retry(day) else day
+
+    def is_staged(self, day: str) -> bool:
+        with self._lock:
+            return day in self.state["staged"]
+
+    def next_retry(self, now: datetime.datetime) -> float | None:
+        """
+        Epoch seconds when the earliest waiting failure may be retried. Failed
+        days that have left the catch-up window (but are kept in the state file
+        for history) will never be retried, so they don't count.
+        """
+        with self._lock:
+            latest = self.latest_due(now)
+            first = self._first_due(latest).isoformat()
+            # The day after `latest` is the one made ahead of time, if any
+            last = (latest + datetime.timedelta(days=1 if self.ahead else 0)).isoformat()
+            times = [
+                info["at"] + DAEMON_RETRY_INTERVAL
+                for day, info in self.state["failed"].items()
+                if first <= day <= last and day not in self.state["completed"]
+            ]
+        return min(times) if times else None
+
+    def record(self, day: str, succeeded: bool, seconds: float, staged: bool = False) -> None:
+        with self._lock:
+            if succeeded:
+                self.state["staged" if staged else "completed"][day] = {"at": time.time(), "seconds": round(seconds, 2)}
+                self.state["failed"].pop(day, None)
+                if not staged:
+                    self.state["staged"].pop(day, None)
+            else:
+                attempts = self.state["failed"].get(day, {}).get("attempts", 0) + 1
+                self.state["failed"][day] = {"at": time.time(), "attempts": attempts}
+            self._save()
+
+    def status(self) -> dict:
+        now = clock.now()
+        latest = self.latest_due(now).isoformat()
+        stage_at = self.stage_at(now)
+        with self._lock:
+            healthy = latest in self.state["completed"] or self.running == latest
+            return {
+                "status": "ok" if healthy else "behind",
+                "timezone": AICALART_TIMEZONE,
+                "now": now.isoformat(),
+                "started_at": self.started_at.isoformat(),
+                "run_at": self.run_at.strftime("%H:%M"),
+                "next_run": self.next_run(now).isoformat(),
+                "next_stage": stage_at.isoformat() if stage_at else None,
+                "latest_due": latest,
+                "running": self.running,
+                "completed": sorted(self.state["completed"])[-10:],
+                "staged": sorted(self.state["staged"]),
+                "failed": self.state["failed"],
+                "openrouter": transport.connection_stats(),
+            }
+
+
+def serve_status(scheduler: Scheduler, host: str, port: int) -> ThreadingHTTPServer:
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            status = scheduler.status()
+            if self.path == "/health":
+                code, payload = (200 if status["status"] == "ok" else 503), {"status": status["status"]}
+            elif self.path == "/status":
+                code, payload = 200, status
+            else:
+                code, payload = 404, {"error": "not found"}
+            data = json.dumps(payload, indent=2).encode("utf-8")
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, name="daemon-status", daemon=True).start()
+    logger.info(f"Status endpoint on http://{host}:{server.server_port}/status")
+    return server
+
+
+def warm_up(run_args: dict) -> None:
+    """Refresh credentials and open connections ahead of a run, so the run doesn't pay for them."""
+    t1 = time.perf_counter()
+    try:
+        transport.get_session().get(f"{OPENROUTER_BASE_URL}/models", timeout=10)
+    except Exception as e:
+        logger.warning(f"Could not warm up the OpenRouter connection: {e}")
+    if not run_args.get("skip_upload") and hosting.configured():
+        try:
+            hosting.get_manager().warm()
+        except Exception as e:
+            logger.warning(f"Could not warm up the SFTP connection: {e}")
+    if not run_args.get("skip_calendar"):
+        try:
+            from gcal import get_calendar_service, get_credentials_manager
+
+            get_calendar_service(get_credentials_manager().get())
+        except Exception as e:
+            logger.warning(f"Could not warm up Google credentials: {e}")
+    logger.info(f"Warmed up. [{time.perf_counter() - t1:.2f} seconds]")
+
+
+def run_day(scheduler: Scheduler, day: str, run_args: dict, publish: bool = True) -> bool:
+    """Make `day`; unless `publish`, it's uploaded under hidden names and recorded as staged."""
+    scheduler.running = day
+    logger.info(f"{Fore.CYAN}Making {day}{'' if publish else ' ahead of time'}{Style.RESET_ALL}")
+    t1 = time.perf_counter()
+    try:
+        # A retry (or the first run after a crash) carries on from the last run's checkpoints
+        succeeded = bool(generate.main(the_date=day, publish=publish, resume=True, **run_args))
+    except Exception as e:
+        logger.exception(f"Run for {day} crashed: {e}")
+        succeeded = False
+    finally:
+        scheduler.running = None
+    seconds = time.perf_counter() - t1
+    scheduler.record(day, succeeded, seconds, staged=not publish)
+    if not succeeded:
+        logger.info(f"{Fore.RED}{day} failed; retrying in {DAEMON_RETRY_INTERVAL:.0f} seconds{Style.RESET_ALL}")
+    return succeeded
+
+
+def publish_day(scheduler: Scheduler, day: str) -> bool:
+    """Put a day made ahead of time live."""
+    t1 = time.perf_counter()
+    try:
+        succeeded = asyncio.run(promote.publish(day))
+    except Exception as e:
+        logger.exception(f"Publishing {day} crashed: {e}")
+        succeeded = False
+    scheduler.record(day, succeeded, time.perf_counter() - t1)
+    if not succeeded:
+        logger.info(f"{Fore.RED}Publishing {day} failed; retrying in {DAEMON_RETRY_INTERVAL:.0f} seconds{Style.RESET_ALL}")
+    return succeeded
+
+
+def run_forever(scheduler: Scheduler, run_args: dict, stop: threading.Event) -> None:
+    warmed_for = None
+    while not stop.is_set():
+        for day in scheduler.due_days(clock.now()):
+            if stop.is_set():
+                return
+            if scheduler.is_staged(day):
+                publish_day(scheduler, day)
+            else:
+                run_day(scheduler, day, run_args)
+
+        day = scheduler.day_to_stage(clock.now())
+        if day and not stop.is_set():
+            run_day(scheduler, day, run_args, publish=False)
+
+        now = clock.now()
+        next_run = scheduler.next_run(now)
+        stage_at = scheduler.stage_at(now)
+        wake = next_run.timestamp()
+        next_retry = scheduler.next_retry(now)
+        if next_retry is not None:
+            wake = min(wake, next_retry)
+        # Warm up ahead of whichever generation comes next
+        next_generation = stage_at if stage_at is not None else next_run
+        if stage_at is not None:
+            wake = min(wake, stage_at.timestamp())
+        warm_at = next_generation.timestamp() - DAEMON_WARMUP_SECONDS
+        if warmed_for != next_generation and time.time() >= warm_at:
+            warm_up(run_args)
+            warmed_for = next_generation
+        elif warmed_for != next_generation:
+            wake = min(wake, warm_at)
+
+        logger.info(f"Next run at {next_run.isoformat()}")
+        # Wake at least hourly, so a changed clock (or a suspended machine) can't oversleep a run,
+        # and never spin, whatever a stale wake-up time says
+        stop.wait(max(MIN_WAIT_SECONDS, min(wake - time.time(), 3600)))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stay resident and make each day's art on schedule.")
+    parser.add_argument("--run-at", default=DAEMON_RUN_AT, help=f"Local time to run, HH:MM in {AICALART_TIMEZONE} (default: {DAEMON_RUN_AT}).")
+    parser.add_argument(
+        "--ahead",
+        type=float,
+        default=DAEMON_AHEAD_HOURS,
+        help="Make each day this many hours before its cutover and publish it at the cutover; 0 turns it off.",
+    )
+    parser.add_argument("--status-port", type=int, default=DAEMON_STATUS_PORT, help="Port for /health and /status; 0 turns it off.")
+    generate.add_run_arguments(parser)
+    args = parser.parse_args()
+    run_args = generate.run_args_from(args)
+    if args.ahead and args.skip_upload:
+        logger.warning("--skip-upload leaves nothing to publish; making each day at its cutover instead")
+        args.ahead = 0
+
+    scheduler = Scheduler(parse_run_at(args.run_at), ahead_hours=args.ahead)
+    if args.status_port:
+        serve_status(scheduler, DAEMON_STATUS_HOST, args.status_port)
+
+    stop = threading.Event()
+
+    def request_stop(signum, frame):
+        logger.info("Stopping after the current run...")
+        stop.set()
+
+    signal.signal(signal.SIGTERM, request_stop)
+    signal.signal(signal.SIGINT, request_stop)
+
+    logger.info(f"Daemon started; making each day's art at {args.run_at} {AICALART_TIMEZONE}")
+    warm_up(run_args)
+    run_forever(scheduler, run_args, stop)
@@ -1,12 +1,8 @@
 import asyncio
-import asyncssh
 import logging
 from colorama import Fore, Style
-from constants import (
-    AICALART_SFTP_SERVER,
-    AICALART_SFTP_USERNAME,
-    AICALART_SFTP_PASSWORD,
-)
+
+import hosting
 
 class CustomFormatter(logging.Formatter):
     format_dict = {
@@ -32,21 +28,14 @@ logger.addHandler(ch)
 REMOTE_BASE = "/media/sdc1/eddielomax/www/aical.art/public_html"
 
 async def upload_file_via_sftp(local_path, remote_path):
-    """Upload a file to web hosting via SFTP."""
-    if not all([AICALART_SFTP_SERVER, AICALART_SFTP_USERNAME, AICALART_SFTP_PASSWORD]):
+    """Upload a file to web hosting via SFTP, over the shared connection (see hosting.py)."""
+    if not hosting.configured():
         logger.error("Web hosting credentials not configured")
         return
     
     try:
-        async with asyncssh.connect(
-            AICALART_SFTP_SERVER,
-            username=AICALART_SFTP_USERNAME,
-            password=AICALART_SFTP_PASSWORD,
-            known_hosts=None
-        ) as conn:
-            async with conn.start_sftp_client() as sftp:
-                await sftp.put(local_path, remote_path)
-                logger.info(f"Uploaded {local_path} to {remote_path}")
+        await hosting.get_manager().put(local_path, remote_path)
+        logger.info(f"Uploaded {local_path} to {remote_path}")
     except FileNotFoundError:
         logger.error(f"The file was not found: {local_path}")
     except Exception as e:
@@ -54,20 +43,13 @@ async def upload_file_via_sftp(local_path, remote_path):
 
 async def upload_directory_via_sftp(local_dir, remote_dir):
     """Upload a directory recursively to web hosting via SFTP."""
-    if not all([AICALART_SFTP_SERVER, AICALART_SFTP_USERNAME, AICALART_SFTP_PASSWORD]):
+    if not hosting.configured():
         logger.error("Web hosting credentials not configured")
         return
     
     try:
-        async with asyncssh.connect(
-            AICALART_SFTP_SERVER,
-            username=AICALART_SFTP_USERNAME,
-            password=AICALART_SFTP_PASSWORD,
-            known_hosts=None
-        ) as conn:
-            async with conn.start_sftp_client() as sftp:
-                await sftp.put(local_dir, remote_dir, recurse=True, preserve=True)
-                logger.info(f"Uploaded directory {local_dir} to {remote_dir}")
+        await hosting.get_manager().put(local_dir, remote_dir, recurse=True, preserve=True)
+        logger.info(f"Uploaded directory {local_dir} to {remote_dir}")
     except Exception as e:
         logger.error(f"Error uploading directory {local_dir} via SFTP: {e}")
 
@@ -0,0 +1,215 @@
+"""
+Local SQLite copy of the Google Calendar events used in prompts.
+
+Each calendar is kept current with the Calendar API's incremental sync: the
+first sync lists every event and stores the `nextSyncToken`, and every later
+sync asks only for what changed since. A day's events are then read from the
+local index, so a daily run costs one small request per calendar and a year of
+backfill costs a handful instead of 365.
+"""
+
+import datetime
+import json
+import logging
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+import clock
+from constants import GOOGLE_CALENDAR_SYNC_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+STORE_PATH = Path(__file__).parent / "cache" / "calendar_events.sqlite3"
+
+# The most events.list will return in one page
+PAGE_SIZE = 2500
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    calendar_id TEXT NOT NULL,
+    event_id TEXT NOT NULL,
+    start_utc TEXT NOT NULL,
+    end_utc TEXT NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (calendar_id, event_id)
+);
+CREATE INDEX IF NOT EXISTS events_by_start ON events (calendar_id, start_utc);
+CREATE TABLE IF NOT EXISTS sync_state (
+    calendar_id TEXT PRIMARY KEY,
+    sync_token TEXT,
+    synced_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS settings (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+_sync_lock = threading.Lock()
+
+# Stores whose all-day events this process has checked the indexing of
+_reindexed = set()
+_reindex_lock = threading.Lock()
+
+
+def _connect(path: Path | None = None) -> sqlite3.Connection:
+    """A new connection to the store, with its schema in place; the caller closes it."""
+    path = path or STORE_PATH
+    path.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(path)
+    conn.executescript(SCHEMA)
+    with _reindex_lock:
+        if path not in _reindexed:
+            _reindex_all_day(conn)
+            _reindexed.add(path)
+    return conn
+
+
+def _reindex_all_day(conn: sqlite3.Connection) -> None:
+    """
+    All-day events are indexed from local midnight, so they need indexing again
+    if AICALART_TIMEZONE has changed since they were stored (or they were
+    stored before this was the rule, at midnight UTC).
+    """
+    timezone = clock.TIMEZONE.key
+    row = conn.execute("SELECT value FROM settings WHERE key = 'all_day_timezone'").fetchone()
+    if row and row[0] == timezone:
+        return
+    with conn:
+        for calendar_id, event_id, data in conn.execute(
+            "SELECT calendar_id, event_id, data FROM events"
+        ).fetchall():
+            event = json.loads(data)
+            if "date" in event["start"]:
+                conn.execute(
+                    "UPDATE events SET start_utc = ?, end_utc = ? WHERE calendar_id = ? AND event_id = ?",
+                    (to_utc(event["start"]), to_utc(event.get("end", event["start"])), calendar_id, event_id),
+                )
+        conn.execute(
+            "INSERT OR REPLACE INTO settings (key, value) VALUES ('all_day_timezone', ?)", (timezone,)
+        )
+
+
+def to_utc(when) -> str:
+    """
+    Normalise an RFC 3339 timestamp, or a Calendar API `start`/`end` dict, to a
+    sortable UTC string like "2024-01-02T14:00:00.000000Z". All-day events
+    (`{"date": ...}`) start at local midnight in AICALART_TIMEZONE, so they fall
+    inside the same day's clock.day_bounds_utc window and no other.
+    """
+    if isinstance(when, dict):
+        if not when.get("dateTime"):
+            day = datetime.date.fromisoformat(when.get("date", "1970-01-01"))
+            local_midnight = datetime.datetime.combine(day, datetime.time(), clock.TIMEZONE)
+            return local_midnight.astimezone(datetime.timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+        when = when["dateTime"]
+    parsed = datetime.datetime.fromisoformat(when.replace("Z", "+00:00"))
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=datetime.timezone.utc)
+    return parsed.astimezone(datetime.timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+
+
+def _apply(conn: sqlite3.Connection, calendar_id: str, events: list) -> None:
+    for event in events:
+        if event.get("status") == "cancelled":
+            conn.execute("DELETE FROM events WHERE calendar_id = ? AND event_id = ?", (calendar_id, event["id"]))
+            continue
+        if "start" not in event:
+            continue
+        conn.execute(
+            "INSERT OR REPLACE INTO events (calendar_id, event_id, start_utc, end_utc, data) VALUES (?, ?, ?, ?, ?)",
+            (
+                calendar_id,
+                event["id"],
+                to_utc(event["start"]),
+                to_utc(event.get("end", event["start"])),
+                json.dumps(event, ensure_ascii=False),
+            ),
+        )
+
+
+def _list_all(service, calendar_id: str, sync_token: str | None) -> tuple:
+    """Every page of a full or incremental listing; returns (events, next_sync_token, api_calls)."""
+    events, page_token, calls = [], None, 0
+    while True:
+        params = {"calendarId": calendar_id, "singleEvents": True, "maxResults": PAGE_SIZE}
+        if sync_token:
+            params["syncToken"] = sync_token
+        if page_token:
+            params["pageToken"] = page_token
+        result = service.events().list(**params).execute()
+        calls += 1
+        events += result.get("items", [])
+        page_token = result.get("nextPageToken")
+        if not page_token:
+            return events, result.get("nextSyncToken"), calls
+
+
+def _sync(conn: sqlite3.Connection, service, calendar_id: str, min_interval: float) -> tuple | None:
+    """Sync one calendar over `conn`; returns (events, sync_token used, api_calls), or None if it's fresh."""
+    from googleapiclient.errors import HttpError
+
+    row = conn.execute("SELECT sync_token, synced_at FROM sync_state WHERE calendar_id = ?", (calendar_id,)).fetchone()
+    sync_token, synced_at = row if row else (None, 0)
+    if sync_token and time.time() - synced_at < min_interval:
+        return None
+
+    try:
+        events, next_sync_token, calls = _list_all(service, calendar_id, sync_token)
+    except HttpError as error:
+        # 410 Gone: the sync token expired, so start over with a full sync
+        if sync_token and error.resp.status == 410:
+            logger.info(f"Sync token for {calendar_id} expired; running a full sync.")
+            sync_token = None
+            events, next_sync_token, calls = _list_all(service, calendar_id, None)
+        else:
+            raise
+
+    if not sync_token:
+        conn.execute("DELETE FROM events WHERE calendar_id = ?", (calendar_id,))
+    _apply(conn, calendar_id, events)
+    conn.execute(
+        "INSERT OR REPLACE INTO sync_state (calendar_id, sync_token, synced_at) VALUES (?, ?, ?)",
+        (calendar_id, next_sync_token, time.time()),
+    )
+    return events, sync_token, calls
+
+
+def sync_calendar(service, calendar_id: str, min_interval: float = GOOGLE_CALENDAR_SYNC_INTERVAL) -> int:
+    """
+    Bring `calendar_id` up to date, unless it was synced in the last `min_interval`
+    seconds. Returns how many API calls it took.
+    """
+    with _sync_lock:
+        conn = _connect()
+        try:
+            with conn:
+                synced = _sync(conn, service, calendar_id, min_interval)
+        finally:
+            conn.close()
+    if synced is None:
+        return 0
+
+    events, sync_token, calls = synced
+    kind = "Incremental" if sync_token else "Full"
+    logger.info(f"{kind} sync of {calendar_id}: {len(events)} change(s) in {calls} request(s)")
+    return calls
+
+
+def events_between(calendar_ids: list, time_min: str, time_max: str) -> list:
+    """Stored events from `calendar_ids` that overlap [time_min, time_max), earliest first."""
+    if not calendar_ids:
+        return []
+    placeholders = ", ".join("?" for _ in calendar_ids)
+    conn = _connect()
+    try:
+        rows = conn.execute(
+            f"SELECT data FROM events WHERE calendar_id IN ({placeholders}) "
+            "AND start_utc < ? AND end_utc > ? ORDER BY start_utc",
+            (*calendar_ids, to_utc(time_max), to_utc(time_min)),
+        ).fetchall()
+    finally:
+        conn.close()
+    return [json.loads(data) for (data,) in rows]
@@ -0,0 +1,332 @@
+"""
+Google Calendar source for the daily prompt.
+
+Credentials are read from token.json once and then kept in memory by a
+CredentialsManager, which refreshes them a few minutes before they expire.
+A long-running process (a backfill, say) never re-reads the token file and never
+sends a request with a token that is about to lapse. The Calendar service is
+built once per process, and when its discovery document has to be fetched
+(GOOGLE_DISCOVERY_URL, e.g. a local stand-in for the Google endpoints) the
+document is cached on disk.
+
+The Google client libraries are heavy, so they're imported on first use.
+"""
+
+import datetime
+import hashlib
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+
+from clock import day_bounds_utc, today
+from constants import (
+    GOOGLE_CALENDAR_IDS,
+    GOOGLE_CALENDAR_MAX_EVENTS,
+    GOOGLE_CALENDAR_SYNC,
+    GOOGLE_DISCOVERY_CACHE_TTL,
+    GOOGLE_DISCOVERY_URL,
+    GOOGLE_TOKEN_REFRESH_MARGIN,
+    GOOGLE_TOKEN_URI,
+    SCOPES,
+)
+
+logger = logging.getLogger(__name__)
+
+TOKEN_PATH = "./token.json"
+CREDENTIALS_PATH = "./credentials.json"
+DISCOVERY_CACHE_DIR = Path(__file__).parent / "cache" / "discovery"
+
+# Google caps a batch request at 50 calls
+BATCH_LIMIT = 50
+
+# Recurring events that never belong in a prompt
+IGNORED_RECURRING_EVENT_IDS = {"fbakiorghcmpbacoi7n9o7ft8k"}
+
+CALENDAR_PROMPT = """
+    Remove any personally identifiable information and do not mention dates. Each
+    event is a special one that deserves to share the spotlight with the other
+    elements of the scene we are setting.
+    """
+
+
+def _discovery_cache_class():
+    from googleapiclient.discovery_cache.base import Cache
+
+    class FileDiscoveryCache(Cache):
+        """Discovery documents on disk, one file per URL, good for `ttl` seconds."""
+
+        def __init__(self, directory: Path = DISCOVERY_CACHE_DIR, ttl: float = GOOGLE_DISCOVERY_CACHE_TTL):
+            self.directory = directory
+            self.ttl = ttl
+
+        def _path(self, url: str) -> Path:
+            return self.directory / f"{hashlib.sha256(url.encode('utf-8')).hexdigest()}.json"
+
+        def get(self, url):
+            path = self._path(url)
+            try:
+                if time.time() - path.stat().st_mtime > self.ttl:
+                    return None
+                return path.read_text()
+            except (FileNotFoundError, IOError):
+                return None
+
+        def set(self, url, content):
+            self.directory.mkdir(parents=True, exist_ok=True)
+            path = self._path(url)
+            tmp_path = path.with_suffix(".tmp")
+            tmp_path.write_text(content)
+            os.replace(tmp_path, path)
+
+    return FileDiscoveryCache
+
+
+class CredentialsManager:
+    """
+    Holds the OAuth credentials for the life of the process.
+
+    `get()` returns credentials that are good for at least `refresh_margin`
+    more seconds, refreshing (or, as a last resort, re-authenticating in the
+    browser) only when they aren't. token.json is read once and written back
+    only after it changes.
+    """
+
+    def __init__(
+        self,
+        token_path: str = TOKEN_PATH,
+        credentials_path: str = CREDENTIALS_PATH,
+        refresh_margin: float = GOOGLE_TOKEN_REFRESH_MARGIN,
+    ):
+        self.token_path = token_path
+        self.credentials_path = credentials_path
+        self.refresh_margin = datetime.timedelta(seconds=refresh_margin)
+        self._creds = None
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    def get(self):
+        with self._lock:
+            if not self._loaded:
+                self._creds = self._load()
+                self._loaded = True
+            if self._needs_refresh():
+                self._refresh()
+            return self._creds
+
+    def _load(self):
+        from google.oauth2.credentials import Credentials
+
+        if not os.path.exists(self.token_path):
+            return None
+        creds = Credentials.from_authorized_user_file(self.token_path, SCOPES)
+        if GOOGLE_TOKEN_URI:
+            # from_authorized_user_file always points at Google's token endpoint,
+            # and the copy with_token_uri makes forgets the expiry
+            expiry = creds.expiry
+            creds = creds.with_token_uri(GOOGLE_TOKEN_URI)
+            creds.expiry = expiry
+        return creds
+
+    def _needs_refresh(self) -> bool:
+        creds = self._creds
+        if not creds or not creds.valid:
+            return True
+        if creds.expiry is None:
+            return False
+        # google-auth keeps `expiry` as a naive UTC datetime
+        now = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+        return creds.expiry - now < self.refresh_margin
+
+    def _refresh(self):
+        from google.auth.exceptions import RefreshError
+        from google.auth.transport.requests import Request
+
+        creds = self._creds
+        if creds and creds.refresh_token:
+            try:
+                logger.info("Refreshing Google credentials.")
+                creds.refresh(Request())
+                self._save()
+                return
+            except RefreshError:
+                logger.info("Refresh token invalid, re-authenticating.")
+        else:
+            logger.info("Credentials not found or invalid. Please log in using your web browser.")
+
+        if os.path.exists(self.token_path):
+            os.remove(self.token_path)
+        self._creds = self._authenticate()
+        self._save()
+
+    def _authenticate(self):
+        from google_auth_oauthlib.flow import InstalledAppFlow
+
+        flow = InstalledAppFlow.from_client_secrets_file(self.credentials_path, SCOPES)
+        return flow.run_local_server(port=0)
+
+    def _save(self):
+        with open(self.token_path, "w") as token:
+            token.write(self._creds.to_json())
+
+
+_credentials_manager = None
+_service = None
+_service_creds = None
+# Guards the service cache and every request made through it: the httplib2
+# transport underneath isn't safe to share between threads
+_service_lock = threading.RLock()
+
+
+def get_credentials_manager() -> CredentialsManager:
+    global _credentials_manager
+    with _service_lock:
+        if _credentials_manager is None:
+            _credentials_manager = CredentialsManager()
+        return _credentials_manager
+
+
+def get_calendar_service(creds):
+    """Return the process-wide Calendar service, rebuilding it only if `creds` was replaced."""
+    global _service, _service_creds
+    from googleapiclient.discovery import build
+
+    with _service_lock:
+        if _service is None or _service_creds is not creds:
+            t1 = time.perf_counter()
+            _service = build(
+                "calendar",
+                "v3",
+                credentials=creds,
+                discoveryServiceUrl=GOOGLE_DISCOVERY_URL,
+                cache_discovery=True,
+                cache=_discovery_cache_class()(),
+            )
+            _service_creds = creds
+            logger.info(f"Built Calendar service. [{time.perf_counter() - t1:.2f} seconds]")
+        return _service
+
+
+def resolve_calendar_ids(service) -> list:
+    """GOOGLE_CALENDAR_IDS, with "all" expanded to every calendar on the account."""
+    if GOOGLE_CALENDAR_IDS != ["all"]:
+        return [calendar_id for calendar_id in GOOGLE_CALENDAR_IDS if calendar_id]
+
+    with _service_lock:
+        calendars_result = service.calendarList().list().execute()
+    return [calendar["id"] for calendar in calendars_result.get("items", [])]
+
+
+def fetch_events(service, calendar_ids: list, time_min: str, time_max: str) -> list:
+    """
+    List each calendar's events between `time_min` and `time_max`.
+
+    Several calendars go out as one HTTP batch request (up to BATCH_LIMIT per
+    batch), so adding calendars costs roughly nothing. A calendar that errors is
+    logged and left out rather than failing the rest.
+    """
+    def events_request(calendar_id):
+        return service.events().list(
+            calendarId=calendar_id,
+            timeMin=time_min,
+            timeMax=time_max,
+            maxResults=GOOGLE_CALENDAR_MAX_EVENTS,
+            singleEvents=True,
+            orderBy="startTime",
+        )
+
+    if len(calendar_ids) == 1:
+        with _service_lock:
+            return events_request(calendar_ids[0]).execute().get("items", [])
+
+    results = {}
+
+    def collect(request_id, response, exception):
+        if exception is not None:
+            logger.warning(f"Could not fetch events for calendar {request_id}: {exception}")
+            return
+        results[request_id] = response.get("items", [])
+
+    for offset in range(0, len(calendar_ids), BATCH_LIMIT):
+        batch = service.new_batch_http_request(callback=collect)
+        for calendar_id in calendar_ids[offset:offset + BATCH_LIMIT]:
+            batch.add(events_request(calendar_id), request_id=calendar_id)
+        with _service_lock:
+            batch.execute()
+
+    return [event for calendar_id in calendar_ids for event in results.get(calendar_id, [])]
+
+
+def fetch_events_from_store(service, calendar_ids: list, time_min: str, time_max: str) -> list:
+    """Sync each calendar into the local event store, then read the window from it."""
+    import event_store
+
+    with _service_lock:
+        for calendar_id in calendar_ids:
+            event_store.sync_calendar(service, calendar_id)
+    return event_store.events_between(calendar_ids, time_min, time_max)
+
+
+def _event_start(event) -> str:
+    start = event.get("start", {})
+    return start.get("dateTime") or start.get("date") or ""
+
+
+def rank_events(events: list, limit: int = GOOGLE_CALENDAR_MAX_EVENTS) -> list:
+    """Drop ignored recurring events and duplicates shared between calendars, then keep the earliest `limit`."""
+    seen = set()
+    ranked = []
+    for event in sorted(events, key=_event_start):
+        if event.get("recurringEventId", "") in IGNORED_RECURRING_EVENT_IDS:
+            continue
+        key = event.get("iCalUID") or event.get("id")
+        if key in seen:
+            continue
+        seen.add(key)
+        ranked.append(event)
+    return ranked[:limit]
+
+
+def process_calendars(service, prompt, the_date):
+    from googleapiclient.errors import HttpError
+
+    # The day runs from local midnight to local midnight in AICALART_TIMEZONE
+    start_of_day_utc, end_of_day_utc = day_bounds_utc(the_date or today())
+
+    try:
+        calendar_ids = resolve_calendar_ids(service)
+        if not calendar_ids:
+            logger.info("No calendars found.")
+            return prompt
+
+        t1 = time.perf_counter()
+        if GOOGLE_CALENDAR_SYNC:
+            events = rank_events(fetch_events_from_store(service, calendar_ids, start_of_day_utc, end_of_day_utc))
+        else:
+            events = rank_events(fetch_events(service, calendar_ids, start_of_day_utc, end_of_day_utc))
+        t2 = time.perf_counter()
+        logger.info(f"Fetched events from {len(calendar_ids)} calendar(s). [{t2 - t1:.2f} seconds]")
+
+        if not events:
+            logger.info(f"No upcoming events found for calendar.")
+        else:
+            prompt += "Today also has some key events: "
+            logger.info(f"Upcoming events found for calendar:")
+            for event in events:
+                prompt += str(event["summary"]) + "; "
+                print(f"\n→ {event['summary']}\n")
+            prompt += CALENDAR_PROMPT
+
+        return prompt
+
+    except HttpError as error:
+        logger.error(f"An error occurred: {error}")
+        return prompt
+
+
+def fetch_calendar_entries(prompt, style, the_date):
+    creds = get_credentials_manager().get()
+    service = get_calendar_service(creds)
+
+    return process_calendars(service, prompt, the_date)
@@ -1,68 +1,62 @@
 import argparse
 import asyncio
-import base64
-from datetime import timezone
-import datetime
+import glob
 import json
 import logging
 import os
 import requests
+import threading
 import time
-from base64 import b64decode
-from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from textwrap import dedent
-# from tqdm import tqdm
 
 from colorama import Fore, Style
+from checkpoint import Checkpoint, file_unchanged
+import clock
 from constants import (
-    OPENROUTER_AICALART_API_KEY,
-    OPENROUTER_BASE_URL,
+    BACKFILL_CONCURRENCY,
+    CONTEXT_SOURCE_TIMEOUTS,
+    IMAGE_HEDGING,
+    OPENROUTER_REQUESTS_PER_MINUTE,
     ALWAYS_INCLUDE_IN_PROMPT,
-    GOOGLE_CALENDAR_ID,
     GPT_MODEL,
     IMAGE_MODEL,
     IMAGE_SIZE,
     LANDSCAPE_ASPECT_RATIO,
+    NEWS_PERIOD,
     PORTRAIT_ASPECT_RATIO,
-    SCOPES,
     STYLE_BASES,
     STYLE_PHRASES,
 )
+from hedge import Hedger
 from holidays_helper import get_holiday, get_silly_day, get_todays_holidays_display
+import ledger
+from news import get_headlines
 from randomish import get_random_style
-from gnews import GNews
-from google.auth.exceptions import RefreshError
-from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
-from googleapiclient.errors import HttpError
-from openai import OpenAI
-from PIL import Image, ImageDraw
-from promote import main as promote_file
+import prompt_cache
+import tracing
+from transport import log_connection_stats, post_json
+from retry import FALLBACK_STEPS, STAGE_ATTEMPTS, backoff_delay, describe_step, is_transient, retry_call
+# The news, Google Calendar, imaging and upload stacks are heavy and most runs
+# skip at least one of them, so each is imported inside the function that needs it
 
 import socket
 socket.setdefaulttimeout(150)
 
-logging.basicConfig(level=logging.INFO)
+# Same format gnews used to install when it was imported up front
+logging.basicConfig(format="%(asctime)s - %(message)s", level=logging.INFO, datefmt="%m/%d/%Y %I:%M:%S %p")
 logger = logging.getLogger(__name__)
 
-# for holiday fetching in localtime -- "2023-11-25"
-now_cst = datetime.datetime.now().date().strftime("%Y-%m-%d")
+# Both orientations are generated from the same prompt, so they can be requested at once
+ORIENTATIONS = {
+    "portrait": PORTRAIT_ASPECT_RATIO,
+    "landscape": LANDSCAPE_ASPECT_RATIO,
+}
 
-# for Google calendar event fetching -- "2023-11-25T00:43:27.521185+00:00Z"
-now_utc = now = f"{datetime.datetime.now(timezone.utc).isoformat()}Z"
 
-openai_client = OpenAI(api_key=OPENROUTER_AICALART_API_KEY, base_url=OPENROUTER_BASE_URL)
-
-
-def get_news(country="US", period="1h"):
-    title = ''
-    gn = GNews(language="en", country=country, period=period)
-    top_news = gn.get_top_news()
-    if top_news:
-        news = top_news[0]
-        title = news.get("title", '')
+def get_news(feeds=None, period=NEWS_PERIOD):
+    headlines = get_headlines(feeds, period)
+    title = headlines[0] if headlines else ''
     # news is typically not great. I wish that weren't the case. :|
     news_is_okay = prompt_passes_moderation(title)
 
@@ -98,130 +92,6 @@ def get_today_and_newslist(the_date, holiday, silly_day, news):
     return today, newslist
 
 
-def refresh_credentials(token_path, credentials_path):
-    creds = None
-    if os.path.exists(token_path):
-        creds = Credentials.from_authorized_user_file(token_path, SCOPES)
-
-    if not creds or not creds.valid:
-        logger.info("Credentials not found or invalid.")
-        if creds and creds.expired and creds.refresh_token:
-            try:
-                logger.info("Sending request for credentials refresh.")
-                creds.refresh(Request())
-            except RefreshError:
-                logger.info("Refresh token invalid, re-authenticating.")
-                os.remove(token_path)
-                flow = InstalledAppFlow.from_client_secrets_file(
-                    credentials_path, SCOPES
-                )
-                creds = flow.run_local_server(port=0)
-        else:
-            logger.info("Please log in using your web browser.")
-            if os.path.exists(token_path):
-                os.remove(token_path)
-            flow = InstalledAppFlow.from_client_secrets_file(
-                credentials_path, SCOPES
-            )
-            creds = flow.run_local_server(port=0)
-
-        with open(token_path, "w") as token:
-            token.write(creds.to_json())
-    return creds
-
-
-def process_calendars(creds, prompt, the_date):
-    calendar_prompt = """
-    Remove any personally identifiable information and do not mention dates. Each
-    event is a special one that deserves to share the spotlight with the other
-    elements of the scene we are setting.
-    """
-
-    if the_date:
-        # We're requesting a specific date, so we need to convert to the day's full datetime string
-        now_utc = f"{the_date}T14:00:00.000000Z"
-        today = now_utc.split('T')[0]
-        end_of_day_utc = today + 'T23:59:59.999999Z'
-
-
-    try:
-        service = build("calendar", "v3", credentials=creds, cache_discovery=False)
-        calendars_result = service.calendarList().list().execute()
-        calendars = calendars_result.get("items", [])
-
-        if not calendars:
-            logger.info("No calendars found.")
-            return prompt
-
-        events = []
-
-        # Uncomment for using all calendars
-        # for calendar in tqdm(calendars, desc="Fetching calendars", ncols=75):
-        #     calendar_id = calendar["id"]
-        #     events_result = (
-        #         service.events()
-        #         .list(
-        #             calendarId=calendar_id,
-        #             timeMin=now_utc,
-        #             maxResults=3,
-        #             singleEvents=True,
-        #             orderBy="startTime",
-        #         )
-        #         .execute()
-        #     )
-        #     events += events_result.get("items", [])
-
-        calendar_id = GOOGLE_CALENDAR_ID
-        events_result = (
-            service.events()
-            .list(
-                calendarId=calendar_id,
-                timeMin=now_utc,
-                timeMax=end_of_day_utc,
-                maxResults=3,
-                singleEvents=True,
-                orderBy="startTime",
-            )
-            .execute()
-        )
-        events += events_result.get("items", [])
-        # print(f'Events: {[e for e in events]}')
-
-        if not events:
-            logger.info(f"No upcoming events found for calendar.")
-        else:
-            prompt += "Today also has some key events: "
-            logger.info(f"Upcoming events found for calendar:")
-            for event in events:
-
-                if event.get("recurringEventId", "") == "fbakiorghcmpbacoi7n9o7ft8k":
-                    continue
-
-                prompt += str(event["summary"]) + "; "
-                print(f"\n→ {event['summary']}\n")
-            prompt += calendar_prompt
-
-        return prompt
-
-    except HttpError as error:
-        logger.error(f"An error occurred: {error}")
-        return prompt
-
-
-def fetch_calendar_entries(prompt, style, the_date):
-    token_path = "./token.json"
-    credentials_path = "./credentials.json"
-
-    creds = refresh_credentials(token_path, credentials_path)
-
-    return process_calendars(creds, prompt, the_date)
-
-
-def decode_b64_json(b64_data):
-    json_data = base64.b64decode(b64_data).decode("utf-8")
-    return json.loads(json_data)
-
-
 def prompt_passes_moderation(prompt):
     # Moderation endpoint not available via OpenRouter; the image model
     # (Nano Banana Pro) applies its own content filters.
@@ -229,7 +99,7 @@ def prompt_passes_moderation(prompt):
     return True
 
 
-def write_daily_prompt_json(date, landscape_prompt, portrait_prompt, holidays, style):
+def write_daily_prompt_json(date, landscape_prompt, portrait_prompt, holidays, style, images=None):
     prompt_file_path = f"./staging/prompt-{date}.json"
     clean_landscape = landscape_prompt.strip('"').replace('\\n', '\n')
     clean_portrait = portrait_prompt.strip('"').replace('\\n', '\n')
@@ -245,25 +115,45 @@ def write_daily_prompt_json(date, landscape_prompt, portrait_prompt, holidays, s
         "holidays": holidays,
         "style": style
     }
+    if images:
+        # Per orientation: full "width"/"height", the smaller "variants" on offer
+        # and a tiny "placeholder" data URL to show while the image loads
+        prompt_data["images"] = images
 
     with open(prompt_file_path, "w") as file:
         json.dump(prompt_data, file, indent=4, ensure_ascii=False)
 
 
-def generate_prompt(prompt, style, news, today):
-    print(f"{Fore.YELLOW}Generating prompt...{Style.RESET_ALL}")
-    completion = openai_client.chat.completions.create(
-        model=GPT_MODEL,
-        messages=[
+def prompt_messages(prompt):
+    return [
+        {
+            "role": "system",
+            "content": prompt,
+        },
+        {"role": "user", "content": prompt},
+    ]
+
+
+def generate_prompt(prompt, style, news, today, use_cache=False):
+    messages = prompt_messages(prompt)
+    dalle_prompt = None
+    if use_cache:
+        dalle_prompt = prompt_cache.get(prompt_cache.cache_key(GPT_MODEL, messages))
+        if dalle_prompt:
+            tracing.annotate(cache_hit=True)
+            print(f"{Fore.GREEN}Using cached prompt.{Style.RESET_ALL}")
+
+    if not dalle_prompt:
+        print(f"{Fore.YELLOW}Generating prompt...{Style.RESET_ALL}")
+        completion = post_json(
+            "/chat/completions",
             {
-                "role": "system",
-                "content": prompt,
+                "model": GPT_MODEL,
+                "messages": messages,
             },
-            {"role": "user", "content": prompt},
-        ],
-    )
+        )
 
-    dalle_prompt = completion.choices[0].message.content
+        dalle_prompt = completion["choices"][0]["message"]["content"]
 
     prompt_info = f"""
     Style: {style}\n
@@ -277,16 +167,12 @@ def generate_prompt(prompt, style, news, today):
     # print(f"Prompt '{prompt}' failed moderation. Try with another prompt.")
     # exit()
 
-def generate_image_via_openrouter(prompt, aspect_ratio):
-    """Generate a single image via OpenRouter using Nano Banana Pro."""
-    response = requests.post(
-        url=f"{OPENROUTER_BASE_URL}/chat/completions",
-        headers={
-            "Authorization": f"Bearer {OPENROUTER_AICALART_API_KEY}",
-            "Content-Type": "application/json",
-        },
-        json={
-            "model": IMAGE_MODEL,
+def generate_image_via_openrouter(prompt, aspect_ratio, model=IMAGE_MODEL, cancel=None):
+    """Generate a single image via OpenRouter using Nano Banana Pro; setting `cancel` abandons it."""
+    result = post_json(
+        "/chat/completions",
+        {
+            "model": model,
             "messages": [
                 {"role": "user", "content": prompt}
             ],
@@ -296,102 +182,136 @@ def generate_image_via_openrouter(prompt, aspect_ratio):
                 "image_size": IMAGE_SIZE,
             },
         },
-        timeout=150,
+        cancel=cancel,
     )
-    response.raise_for_status()
-    result = response.json()
 
     message = result["choices"][0]["message"]
     images = message.get("images", [])
     if not images:
         raise ValueError("No images returned in response")
 
-    # Extract base64 data from data URL (format: data:image/png;base64,...)
-    data_url = images[0]["image_url"]["url"]
-    base64_data = data_url.split(",", 1)[1]
-    return base64_data
+    # Hand back the data URL itself (format: data:image/png;base64,...); imaging.py
+    # decodes past the header, so slicing it here would only copy megabytes
+    return images[0]["image_url"]["url"]
 
 
-def generate_images(dalle_prompt, style, image_args, failed_attempts=0):
-    # Let's try to make these things. It could be rejected because god only knows
-    # what the hell it's going to come up with. If it rejects it, just regenerate
-    # and see. Some keywords it will have a problem with... for example, "genocide".
+def _timed_image_request(orientation, prompt, aspect_ratio, image_model, hedger=None):
+    logger.info(f"{Fore.YELLOW}Generating {orientation} image...{Style.RESET_ALL}")
+    logger.info(f"Request parameters: model={image_model}, aspect_ratio={aspect_ratio}, image_size={IMAGE_SIZE}")
+    t1 = time.perf_counter()
+    with tracing.span(f"image.{orientation}", model=image_model, aspect_ratio=aspect_ratio, image_size=IMAGE_SIZE) as span:
+        if hedger:
+            image_data = hedger.call(generate_image_via_openrouter, prompt, aspect_ratio, image_model)
+        else:
+            image_data = generate_image_via_openrouter(prompt, aspect_ratio, image_model)
+        span.set(bytes=len(image_data))
+    t2 = time.perf_counter()
+    logger.info(f"{orientation.capitalize()} response received successfully! [{t2 - t1:.2f} seconds]")
+    return image_data
 
-    (
-        the_date,
-        style,
-        image_model,
-        skip_calendar,
-        skip_holidays,
-        skip_silly_days,
-        skip_news,
-        skip_upload,
-    ) = image_args
 
-    full_prompt = f"{style}, no margins, full screen. {dalle_prompt}"
+def generate_orientations(prompt, image_model, orientations, hedger=None, on_image=None):
+    """
+    Request every orientation at the same time and wait for all of them.
 
-    try:
-        logger.info(f"{Fore.YELLOW}Generating portrait image...{Style.RESET_ALL}")
-        logger.info(f"Request parameters: model={image_model}, aspect_ratio={PORTRAIT_ASPECT_RATIO}, image_size={IMAGE_SIZE}")
-        portrait_data = generate_image_via_openrouter(full_prompt, PORTRAIT_ASPECT_RATIO)
-        logger.info(f"Portrait response received successfully!")
-
-        logger.info(f"{Fore.YELLOW}Generating landscape image...{Style.RESET_ALL}")
-        logger.info(f"Request parameters: model={image_model}, aspect_ratio={LANDSCAPE_ASPECT_RATIO}, image_size={IMAGE_SIZE}")
-        landscape_data = generate_image_via_openrouter(full_prompt, LANDSCAPE_ASPECT_RATIO)
-        logger.info(f"Landscape response received successfully!")
-    except (requests.exceptions.HTTPError, ValueError, KeyError) as e:
-        logger.error(f"Image generation error: {str(e)}")
-        failed_attempts += 1
-
-        if failed_attempts <= 5:
-            # Define a dictionary mapping the attempt number to the changes
-            attempt_changes = {
-                1: {},
-                2: {"skip_news": True},
-                3: {"skip_calendar": True, "skip_news": True},
-                4: {
-                    "skip_calendar": True,
-                    "skip_holidays": True,
-                    "skip_silly_days": True,
-                    "skip_news": True,
-                },
-                5: {
-                    "style": "Bob Ross, with peaceful happy little trees",
-                    "skip_calendar": True,
-                    "skip_holidays": True,
-                    "skip_silly_days": True,
-                    "skip_news": True,
-                },
-            }
-
-            # Get the changes for the current attempt
-            changes = attempt_changes[failed_attempts]
-
-            # Call main with updated arguments
-            main(
-                the_date=the_date,
-                style=changes.get("style", style),
-                model=image_model,
-                skip_calendar=changes.get("skip_calendar", skip_calendar),
-                skip_holidays=changes.get("skip_holidays", skip_holidays),
-                skip_silly_days=changes.get("skip_silly_days", skip_silly_days),
-                skip_news=changes.get("skip_news", skip_news),
-                skip_upload=skip_upload,
-                failed_attempts=failed_attempts,
-            )
-            return True
-        else:
-            logger.info(f"{Fore.RED}Error: could not process images.{Style.RESET_ALL}")
-            exit(1)
+    Returns a `(results, errors)` pair of dicts keyed by orientation, so a failed
+    orientation never costs us one that already finished. `on_image(orientation,
+    image_data)` is called as each one arrives, while the rest are still running.
+    """
+    results, errors = {}, {}
+    if not orientations:
+        return results, errors
+
+    with ThreadPoolExecutor(max_workers=len(orientations)) as executor:
+        futures = {
+            executor.submit(
+                tracing.in_context(_timed_image_request), orientation, prompt, aspect_ratio, image_model, hedger
+            ): orientation
+            for orientation, aspect_ratio in orientations.items()
+        }
+        for future in as_completed(futures):
+            orientation = futures[future]
+            try:
+                results[orientation] = future.result()
+                if on_image:
+                    on_image(orientation, results[orientation])
+            except (requests.exceptions.RequestException, ValueError, KeyError) as e:
+                logger.error(f"{orientation.capitalize()} image generation error: {str(e)}")
+                errors[orientation] = e
+
+    return results, errors
+
+
+def generate_images(dalle_prompt, style, image_model, completed_images=None, hedger=None, checkpoint=None):
+    """
+    Generate every orientation that isn't in `completed_images` yet.
+
+    Transient failures are retried for just the orientations that hit them.
+    Returns the updated `completed_images` (orientation -> (prompt, base64 data))
+    and a dict of the errors that are still outstanding.
+    """
+    full_prompt = f"{style}, no margins, full screen. {dalle_prompt}"
 
     # Clean up the prompt for metadata
     clean_prompt = dalle_prompt.replace('\\n', '\n').replace('\\"', '"')
     for marker in ['**Image Prompt:**\n\n', '**Prompt:** ']:
         clean_prompt = clean_prompt.replace(marker, '')
 
-    portrait_prompt = clean_prompt
-    landscape_prompt = clean_prompt
+    # An orientation that already succeeded is never requested twice
+    completed_images = dict(completed_images or {})
+    pending = {
+        orientation: aspect_ratio
+        for orientation, aspect_ratio in ORIENTATIONS.items()
+        if orientation not in completed_images
+    }
+
+    def checkpoint_image(orientation, image_data):
+        if checkpoint:
+            checkpoint.save(f"image-{orientation}", {"style": style, "prompt": clean_prompt}, text=image_data)
+
+    errors = {}
+    t1 = time.perf_counter()
+    with tracing.span("images", model=image_model, orientations=list(pending)) as span:
+        for attempt in range(STAGE_ATTEMPTS):
+            span.set(retries=attempt)
+            results, errors = generate_orientations(full_prompt, image_model, pending, hedger, checkpoint_image)
+            for orientation, image_data in results.items():
+                completed_images[orientation] = (clean_prompt, image_data)
+
+            # Only retry the same prompt when every failure looks like a hiccup;
+            # a rejected prompt needs a new one, which is the fallback ladder's job
+            if not errors or attempt == STAGE_ATTEMPTS - 1 or not all(is_transient(e) for e in errors.values()):
+                break
+            delay = backoff_delay(attempt)
+            logger.warning(f"Retrying {', '.join(errors)} in {delay:.1f} seconds [{attempt + 1}/{STAGE_ATTEMPTS - 1}]")
+            time.sleep(delay)
+            pending = {orientation: ORIENTATIONS[orientation] for orientation in errors}
+        span.set(failed=list(errors))
+    t2 = time.perf_counter()
+    logger.info(f"Image requests finished. [Total image time: {t2 - t1:.2f} seconds]")
+
+    if errors and completed_images:
+        logger.info(f"Keeping finished image(s): {', '.join(completed_images)}")
+    return completed_images, errors
+
+
+def run_stamp(the_date):
+    """Staging timestamp for a run, e.g. "2023-11-25T00:43:27.521185+00:00Z", dated `the_date`."""
+    return f"{the_date}T{clock.utc_timestamp().split('T', 1)[1]}"
+
+
+def has_staging_output(the_date):
+    """True if `the_date` already has its prompt JSON and both WebPs in staging/."""
+    if not os.path.exists(f"./staging/prompt-{the_date}.json"):
+        return False
+    return all(glob.glob(f"./staging/{orientation}-{the_date}T*.webp") for orientation in ORIENTATIONS)
+
+
+def save_images(the_date, style, completed_images, stamp, checkpoint=None):
+    from imaging import build_derivatives, save_webp
+
+    portrait_prompt = completed_images["portrait"][0]
+    landscape_prompt = completed_images["landscape"][0]
 
     print(f"\nPortrait prompt: {portrait_prompt}")
     print(f"\nLandscape prompt: {landscape_prompt}\n")
@@ -401,26 +321,244 @@ def generate_images(dalle_prompt, style, image_args, failed_attempts=0):
     if not os.path.exists("./staging"):
         os.makedirs("./staging")
 
-    # Update the JSON file with the new prompts and holidays
-    write_daily_prompt_json(the_date, landscape_prompt, portrait_prompt, todays_holidays, style)
+    # Decode and save one orientation at a time, dropping each data URL as soon
+    # as its WebP is on disk so both never sit in memory as decoded images
+    image_paths = {}
+    for orientation in list(ORIENTATIONS):
+        _, image_data = completed_images.pop(orientation)
+        # Save them into the /staging folder that is ignored by git for convenience
+        image_path = image_paths[orientation] = f"./staging/{orientation}-{stamp}.webp"
+        saved = checkpoint and checkpoint.load(f"webp-{orientation}", lambda c: file_unchanged(image_path, c["bytes"]))
+        if saved:
+            logger.info(f"Resuming with {image_path}")
+            continue
+        with tracing.span(f"save.{orientation}", orientation=orientation) as span:
+            size = save_webp(image_data, image_path)
+            span.set(bytes=size)
+        del image_data
+        if checkpoint:
+            checkpoint.save(f"webp-{orientation}", {"bytes": size})
+        logger.info(f"Saved {image_path} ({size / 1024:.0f} KiB)")
+
+    t1 = time.perf_counter()
+    with tracing.span("derivatives") as span:
+        derivatives = build_derivatives(list(image_paths.values()))
+        span.set(bytes=sum(sum(info["bytes"].values()) for info in derivatives.values()))
+    images = {}
+    for orientation, image_path in image_paths.items():
+        info = derivatives[image_path]
+        sizes = ", ".join(f"{width}w {size / 1024:.0f} KiB" for width, size in info.pop("bytes").items())
+        logger.info(
+            f"Resized {orientation}: {sizes or 'no smaller sizes needed'}; "
+            f"placeholder {len(info.get('placeholder', ''))} characters"
+        )
+        images[orientation] = info
+    logger.info(f"Built smaller image sizes. [{time.perf_counter() - t1:.2f} seconds]")
+
+    # Written last, so the JSON never lists an image size that isn't in staging/
+    write_daily_prompt_json(the_date, landscape_prompt, portrait_prompt, todays_holidays, style, images)
+
+    return True
+
+
+def _fetch_sources(sources, timeouts):
+    """
+    Run every source in its own daemon thread, each given its own timeout.
+
+    Daemon threads (rather than an executor) so a source that hangs past its
+    deadline can't hold up the run, or the process exit, while it finishes.
+    Returns name -> (value, error, seconds); `error` is a TimeoutError for a
+    source that ran out of time.
+    """
+    results = {}
+
+    def run(name, func, args):
+        t1 = time.perf_counter()
+        try:
+            with tracing.span(f"context.{name}"):
+                value, error = func(*args), None
+        except Exception as e:
+            value, error = None, e
+        results[name] = (value, error, time.perf_counter() - t1)
+
+    start = time.perf_counter()
+    threads = {}
+    for name, (func, *args) in sources.items():
+        thread = threading.Thread(
+            target=tracing.in_context(run), args=(name, func, args), name=f"context-{name}", daemon=True
+        )
+        thread.start()
+        threads[name] = thread
 
-    # Image processing - decode base64 to PIL Image
-    portrait_image = Image.open(BytesIO(b64decode(portrait_data)))
-    landscape_image = Image.open(BytesIO(b64decode(landscape_data)))
+    for name, thread in threads.items():
+        timeout = timeouts[name]
+        thread.join(max(timeout - (time.perf_counter() - start), 0))
+        if name not in results:
+            results[name] = (None, TimeoutError(f"no answer after {timeout:.0f} seconds"), timeout)
 
-    ImageDraw.Draw(portrait_image)
-    ImageDraw.Draw(landscape_image)
+    # Snapshot, so a straggler finishing late can't change what the caller sees
+    return dict(results)
 
-    # Save them into the /staging folder that is ignored by git for convenience
-    portrait_image_path = f"./staging/portrait-{now}.webp"
-    portrait_image.save(portrait_image_path, format="webp")
 
-    landscape_image_path = f"./staging/landscape-{now}.webp"
-    landscape_image.save(landscape_image_path, format="webp")
+def gather_context(the_date, style, skip_calendar, skip_holidays, skip_silly_days, skip_news):
+    """
+    Fetch everything the prompt is built from, once per run.
+
+    The sources run in parallel, each bounded by CONTEXT_SOURCE_TIMEOUTS. One that
+    fails or runs out of time is treated as skipped instead of blocking the others.
+    """
+    context = {"holiday": None, "silly_day": None, "news": None, "calendar": ""}
+
+    sources = {}
+    if not skip_holidays:
+        sources["holiday"] = (get_holiday, the_date)
+    if not skip_silly_days:
+        sources["silly_day"] = (get_silly_day, the_date)
+    if not skip_news:
+        sources["news"] = (get_news,)
+    if not skip_calendar:
+        from gcal import fetch_calendar_entries
 
-    if landscape_image and portrait_image:
-        return True
-    return False
+        sources["calendar"] = (fetch_calendar_entries, "", style, the_date)
+    if not sources:
+        return context
+
+    t1 = time.perf_counter()
+    with tracing.span("context", sources=list(sources)):
+        results = _fetch_sources(sources, CONTEXT_SOURCE_TIMEOUTS)
+    t2 = time.perf_counter()
+
+    timings = []
+    for name in sources:
+        value, error, seconds = results[name]
+        if error is None:
+            context[name] = value
+            timings.append(f"{name} {seconds:.2f}s")
+        else:
+            logger.warning(f"Context source '{name}' failed, skipping it: {error}")
+            timings.append(f"{name} skipped after {seconds:.2f}s")
+
+    logger.info(f"Context gathered in {t2 - t1:.2f} seconds ({', '.join(timings)})")
+    return context
+
+
+def apply_fallback(context, changes):
+    """Drop the parts of an already-gathered context that a fallback step skips."""
+    context = dict(context)
+    if changes.get("skip_holidays"):
+        context["holiday"] = None
+    if changes.get("skip_silly_days"):
+        context["silly_day"] = None
+    if changes.get("skip_news"):
+        context["news"] = None
+    if changes.get("skip_calendar"):
+        context["calendar"] = ""
+    return context
+
+
+def build_prompt(the_date, style, context):
+    today, newslist = get_today_and_newslist(
+        the_date, context["holiday"], context["silly_day"], context["news"]
+    )
+
+    prompt = f"""
+    You are an expert prompt creator for AI image generation. You specialize in creating images based on current {newslist}.
+    You incorporate the pure embodiment of the style of {style} into your creations-- you take it to the extreme. Really push your limits for organic, creative, and clever imagery.
+    You are exceptionally clever and inventive by hiding allegories in details.
+    A user could look at one of your creations several times and discover something new, insightful, or hilarious on each repeated viewing.
+    {ALWAYS_INCLUDE_IN_PROMPT}
+    Today is {today}.
+    Craft a prompt for a scene that incorporates all of these elements together into a spectacular work of art.
+    Don't take the easy way out to put the date or the special day's message in text in the image, instead... show me what today is through art. Make it interpretive.
+    Use the full screen, no margins.
+    IMPORTANT: Respond with the prompt only.
+    """
+    prompt += context["calendar"]
+
+    return prompt, today
+
+
+def generate_with_fallbacks(
+    the_date,
+    style,
+    image_model,
+    context,
+    prompt_cache_enabled=True,
+    refresh_prompt=False,
+    hedger=None,
+    checkpoint=None,
+):
+    """
+    Walk FALLBACK_STEPS until both orientations exist.
+
+    Each step only redoes the prompt and whichever images are still missing.
+    Returns `(style, completed_images)`, or None if every step failed.
+
+    Only the first step may read the prompt cache (later steps exist precisely to
+    get a different prompt), and a prompt is only cached once its images came back.
+
+    Resuming from `checkpoint` starts at the last step that got as far as a
+    prompt, with that prompt and any of the step style's images already made.
+    If every step fails, their prompts and images are dropped from it, so a
+    retry starts from the first step again.
+    """
+    completed_images = {}
+    previous_style = style
+    levels = checkpoint.prompt_levels() if checkpoint else []
+    resume_level = levels[-1] if levels else 0
+
+    for level, changes in enumerate(FALLBACK_STEPS):
+        if level < resume_level:
+            continue
+        step_style = changes.get("style", style)
+        if step_style != previous_style:
+            # A new style means the finished images no longer match the metadata
+            completed_images = {}
+        previous_style = step_style
+
+        if checkpoint:
+            for orientation in ORIENTATIONS:
+                if orientation in completed_images:
+                    continue
+                saved = checkpoint.load(f"image-{orientation}", lambda c: c["style"] == step_style)
+                image_data = saved and checkpoint.load_text(f"image-{orientation}")
+                if image_data:
+                    logger.info(f"Resuming with the checkpointed {orientation} image")
+                    completed_images[orientation] = (saved["prompt"], image_data)
+
+        if level:
+            logger.info(f"{Fore.YELLOW}Fallback {level}/{len(FALLBACK_STEPS) - 1}: {describe_step(changes)}{Style.RESET_ALL}")
+
+        step_context = apply_fallback(context, changes)
+        prompt, today = build_prompt(the_date, step_style, step_context)
+        use_cache = prompt_cache_enabled and not refresh_prompt and level == 0
+        saved = checkpoint and checkpoint.load(f"prompt-{level}", lambda c: c["prompt"] == prompt)
+        if saved:
+            logger.info("Resuming with the checkpointed prompt")
+            dalle_prompt = saved["dalle_prompt"]
+        else:
+            with tracing.span("prompt", model=GPT_MODEL, fallback_level=level, use_cache=use_cache):
+                dalle_prompt = retry_call(
+                    generate_prompt, prompt, step_style, step_context["news"], today, use_cache, label="Prompt generation"
+                )
+            if checkpoint:
+                checkpoint.save(f"prompt-{level}", {"prompt": prompt, "dalle_prompt": dalle_prompt})
+
+        completed_images, errors = generate_images(
+            dalle_prompt, step_style, image_model, completed_images, hedger, checkpoint
+        )
+        if not errors:
+            if prompt_cache_enabled:
+                prompt_cache.put(prompt_cache.cache_key(GPT_MODEL, prompt_messages(prompt)), GPT_MODEL, dalle_prompt)
+            return step_style, completed_images
+
+    if checkpoint:
+        # Resuming at the last step would only repeat what just failed, so a retry starts the steps over
+        for level in checkpoint.prompt_levels():
+            checkpoint.forget(f"prompt-{level}")
+        for orientation in ORIENTATIONS:
+            checkpoint.forget(f"image-{orientation}")
+    return None
 
 
 def main(
@@ -432,7 +570,12 @@ def main(
     skip_silly_days=False,
     skip_news=False,
     skip_upload=False,
-    failed_attempts=0,
+    stamp=None,
+    prompt_cache_enabled=True,
+    refresh_prompt=False,
+    hedge=None,
+    publish=True,
+    resume=False,
 ):
     # Time it from beginning to end
     t1 = time.perf_counter()
@@ -449,70 +592,87 @@ def main(
         logger.info(f"Skipping: {skipped_args_str}\n")
 
     # `the_date`, e.g. '2023-11-26', is used in keys for the holiday dicts
-    the_date = the_date or now_cst.split("T")[0]  # fmt: skip
-    the_day = ""  # placeholder for any named days, e.g. "Cyber Monday and National Fritters Day"
-    style = style or get_style()
-
-    image_model = model or IMAGE_MODEL
-
-    holiday = None if skip_holidays else get_holiday(the_date)
-    silly_day = None if skip_silly_days else get_silly_day(the_date)
-    news = None if skip_news else get_news()
+    the_date = the_date or clock.today()
 
-    today, newslist = get_today_and_newslist(the_date, holiday, silly_day, news)
-
-    prompt = f"""
-    You are an expert prompt creator for AI image generation. You specialize in creating images based on current {newslist}.
-    You incorporate the pure embodiment of the style of {style} into your creations-- you take it to the extreme. Really push your limits for organic, creative, and clever imagery.
-    You are exceptionally clever and inventive by hiding allegories in details.
-    A user could look at one of your creations several times and discover something new, insightful, or hilarious on each repeated viewing.
-    {ALWAYS_INCLUDE_IN_PROMPT}
-    Today is {today}.
-    Craft a prompt for a scene that incorporates all of these elements together into a spectacular work of art.
-    Don't take the easy way out to put the date or the special day's message in text in the image, instead... show me what today is through art. Make it interpretive.
-    Use the full screen, no margins.
-    IMPORTANT: Respond with the prompt only.
-    """
+    # A resumed run keeps the style and stamp it started with, so its checkpoints still apply
+    checkpoint = Checkpoint(the_date, resume=resume)
+    started = checkpoint.load("run") or {}
+    style = style or started.get("style") or get_style()
 
-    if not skip_calendar:
-        prompt = fetch_calendar_entries(prompt, style, the_date)
-
-    dalle_prompt = generate_prompt(prompt, style, news, today)
-
-    image_args = (
-        the_date,
-        style,
-        image_model,
-        skip_calendar,
-        skip_holidays,
-        skip_silly_days,
-        skip_news,
-        skip_upload,
-    )
+    # Staging files are keyed by this; pinning it to `the_date` keeps every day's
+    # outputs apart when several dates run in one process (see backfill.py)
+    stamp = stamp or started.get("stamp") or run_stamp(the_date)
+    checkpoint.save("run", {"style": style, "stamp": stamp})
 
-    successful_result = generate_images(dalle_prompt, style, image_args, failed_attempts)
+    image_model = model or IMAGE_MODEL
+    hedger = Hedger(enabled=IMAGE_HEDGING if hedge is None else hedge)
+
+    with tracing.run(
+        "generate",
+        f"./staging/trace-{stamp}.json",
+        on_finish=ledger.recorder("generate"),
+        date=the_date,
+        model=image_model,
+    ) as run_span:
+        saved = checkpoint.load(
+            "saved", lambda c: c["stamp"] == stamp and all(file_unchanged(p, size) for p, size in c["files"].items())
+        )
+        if saved:
+            logger.info("Resuming with the images already saved in staging/")
+            style, outcome = saved["style"], True
+        else:
+            context = checkpoint.load("context")
+            if context is None:
+                context = gather_context(the_date, style, skip_calendar, skip_holidays, skip_silly_days, skip_news)
+                checkpoint.save("context", context)
+            else:
+                logger.info("Resuming with the checkpointed context")
+
+            outcome = generate_with_fallbacks(
+                the_date, style, image_model, context, prompt_cache_enabled, refresh_prompt, hedger, checkpoint
+            )
 
-    t2 = time.perf_counter()
+        if saved:
+            successful_result = True
+        elif outcome:
+            style, completed_images = outcome
+            with tracing.span("save"):
+                successful_result = save_images(the_date, style, completed_images, stamp, checkpoint)
+            staged_files = glob.glob(f"./staging/*-{glob.escape(stamp)}*.webp") + [f"./staging/prompt-{the_date}.json"]
+            checkpoint.save(
+                "saved", {"style": style, "stamp": stamp, "files": {p: os.path.getsize(p) for p in staged_files}}
+            )
+        else:
+            logger.info(f"{Fore.RED}Error: could not process images.{Style.RESET_ALL}")
+            successful_result = False
+        run_span.set(style=style, succeeded=successful_result)
 
-    if successful_result:
-        logger.info(f"{Fore.CYAN}Generation complete.{Style.RESET_ALL} [Total time: {t2 - t1:.2f} seconds]\n\n")  # fmt: skip
-    else:
-        logger.info(f"{Fore.RED}Generation failed.{Style.RESET_ALL} [Total time: {t2 - t1:.2f} seconds]\n\n")  # fmt: skip
-        exit(1)
+        t2 = time.perf_counter()
+        log_connection_stats()
+        hedger.log_summary()
 
-    if not skip_upload:
-        asyncio.run(promote_file(now))
+        if successful_result:
+            logger.info(f"{Fore.CYAN}Generation complete.{Style.RESET_ALL} [Total time: {t2 - t1:.2f} seconds]\n\n")  # fmt: skip
+        else:
+            logger.info(f"{Fore.RED}Generation failed.{Style.RESET_ALL} [Total time: {t2 - t1:.2f} seconds]\n\n")  # fmt: skip
+            return False
+
+        if not skip_upload:
+            from promote import main as promote_file
+
+            # Unpublished runs go up under hidden names for promote.publish() to put live later
+            uploaded = asyncio.run(promote_file(stamp, hidden=not publish, checkpoint=checkpoint))
+            if not uploaded:
+                # The ledger row should say the run failed, since it exits 1
+                run_span.set(succeeded=False)
+                # Keep the checkpoints, so --resume only retries the uploads that didn't make it
+                return False
+    checkpoint.discard()
+    return True
 
 
-if __name__ == "__main__":
-    parser = argparse.ArgumentParser(
-        description="Generate an AI calendar art piece with a specific style and/or from a specific date."
-    )
-    parser.add_argument(
-        "--date",
-        default=None,
-        help='Date for the calendar prompt (e.g., "2023-11-25").',
-    )
+def add_run_arguments(parser):
+    """Options for how a day is generated, shared by generate.py and daemon.py."""
     parser.add_argument(
         "--style",
         default=None,
@@ -548,9 +708,28 @@ if __name__ == "__main__":
         action="store_true",
         help="Skip uploading generated images. Useful for experimenting with styles or prompts. Will store generated images in the staging/ folder.",
     )
-    args = parser.parse_args()
-    main(
-        the_date=args.date,  # the_date because date contextually means an object
+    parser.add_argument(
+        "--no-prompt-cache",
+        action="store_true",
+        help="Always ask the LLM for a fresh prompt and don't cache it.",
+    )
+    parser.add_argument(
+        "--refresh-prompt",
+        action="store_true",
+        help="Ignore any cached prompt for this date/style/context, but cache the new one.",
+    )
+    parser.add_argument(
+        "--hedge",
+        action="store_true",
+        default=None,
+        help="Send a duplicate of an image request that runs long and keep whichever answers first (see IMAGE_HEDGING).",
+    )
+    return parser
+
+
+def run_args_from(args):
+    """`main()` keyword arguments from options added by add_run_arguments."""
+    return dict(
         style=args.style,
         model=args.model,
         skip_calendar=True,  # args.skip_calendar,
@@ -558,4 +737,74 @@ if __name__ == "__main__":
         skip_silly_days=args.skip_silly_days,
         skip_news=True,  # args.skip_news,
         skip_upload=args.skip_upload,
+        prompt_cache_enabled=not args.no_prompt_cache,
+        refresh_prompt=args.refresh_prompt,
+        hedge=args.hedge,
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Generate an AI calendar art piece with a specific style and/or from a specific date."
+    )
+    parser.add_argument(
+        "--date",
+        default=None,
+        help='Date for the calendar prompt (e.g., "2023-11-25").',
+    )
+    add_run_arguments(parser)
+    parser.add_argument(
+        "--from",
+        dest="from_date",
+        default=None,
+        help='Backfill every date from this one (e.g., "2024-01-01") through --to, skipping dates already in staging/.',
     )
+    parser.add_argument(
+        "--to",
+        dest="to_date",
+        default=None,
+        help="Last date to backfill (inclusive). Defaults to today.",
+    )
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=BACKFILL_CONCURRENCY,
+        help=f"How many dates a backfill generates at once (default: {BACKFILL_CONCURRENCY}).",
+    )
+    parser.add_argument(
+        "--rpm",
+        type=int,
+        default=OPENROUTER_REQUESTS_PER_MINUTE,
+        help="Cap on OpenRouter requests per minute across all workers; 0 means no cap.",
+    )
+    parser.add_argument(
+        "--no-publish",
+        action="store_true",
+        help="Upload under hidden names instead of putting the day live; publish it later with promote.py --publish DATE.",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Pick up an interrupted run for the date where it stopped, skipping every stage it already finished.",
+    )
+    args = parser.parse_args()
+    run_args = run_args_from(args)
+    run_args["publish"] = not args.no_publish
+    run_args["resume"] = args.resume
+    if args.from_date:
+        from backfill import date_range, run_backfill
+
+        summary = run_backfill(
+            date_range(args.from_date, args.to_date or clock.today()),
+            main,
+            has_staging_output,
+            concurrency=args.concurrency,
+            requests_per_minute=args.rpm,
+            **run_args,
+        )
+        succeeded = not summary["failed"]
+    else:
+        succeeded = main(the_date=args.date, **run_args)  # the_date because date contextually means an object
+
+    if not succeeded:
+        exit(1)
@@ -0,0 +1,192 @@
+"""
+Hedged image requests, to cut the long tail of image generation latency.
+
+An image request that hasn't answered within HEDGE_PERCENTILE of recent image
+latencies gets a duplicate. Whichever comes back first is used, and the other
+is cancelled: its socket is shut down straight away, even while it's still
+waiting for OpenRouter to answer, which frees its pooled connection (OpenRouter
+still bills for it). Duplicates are capped per run by HEDGE_MAX_EXTRA_REQUESTS.
+
+Recent latencies and lifetime counters (how often a hedge was sent, and how
+often it beat the original) are kept in cache/hedging.json. Latencies are
+recorded even with hedging off, so the percentile is ready when it's turned on.
+"""
+
+import json
+import logging
+import math
+import os
+import queue
+import threading
+import time
+from pathlib import Path
+
+import tracing
+from constants import (
+    HEDGE_DEFAULT_DELAY,
+    HEDGE_MAX_EXTRA_REQUESTS,
+    HEDGE_MIN_SAMPLES,
+    HEDGE_PERCENTILE,
+)
+
+logger = logging.getLogger(__name__)
+
+STATS_PATH = Path(__file__).parent / "cache" / "hedging.json"
+
+# Latencies kept for the percentile
+HISTORY_SIZE = 50
+
+COUNTERS = ("requests", "hedged", "hedge_won", "primary_won", "over_budget")
+
+_stats_lock = threading.Lock()
+
+
+def percentile(values: list, pct: float) -> float:
+    """Nearest-rank percentile of `values`."""
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def load_stats(path: Path | None = None) -> dict:
+    path = path or STATS_PATH
+    try:
+        with open(path) as f:
+            stats = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError, IOError):
+        stats = {}
+    stats.setdefault("latencies", [])
+    stats["counters"] = {name: stats.get("counters", {}).get(name, 0) for name in COUNTERS}
+    return stats
+
+
+class Hedger:
+    """
+    Hedging state for one run: the delay before a duplicate is sent, what's
+    left of the run's duplicate budget, and this run's counters.
+    """
+
+    def __init__(
+        self,
+        enabled: bool = True,
+        pct: float = HEDGE_PERCENTILE,
+        max_extra: int = HEDGE_MAX_EXTRA_REQUESTS,
+        min_samples: int = HEDGE_MIN_SAMPLES,
+        default_delay: float = HEDGE_DEFAULT_DELAY,
+    ):
+        self.enabled = enabled and max_extra > 0
+        self.pct = pct
+        self.max_extra = max_extra
+        self.min_samples = min_samples
+        self.default_delay = default_delay
+        self.history = load_stats()["latencies"]
+        self.latencies = []
+        self.counters = dict.fromkeys(COUNTERS, 0)
+        self._lock = threading.Lock()
+
+    def delay(self) -> float:
+        """Seconds to wait for a request before hedging it."""
+        with self._lock:
+            samples = (self.history + self.latencies)[-HISTORY_SIZE:]
+        if len(samples) < self.min_samples:
+            return self.default_delay
+        return percentile(samples, self.pct)
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self.counters[name] += 1
+
+    def _reserve(self) -> bool:
+        with self._lock:
+            if self.counters["hedged"] >= self.max_extra:
+                self.counters["over_budget"] += 1
+                return False
+            self.counters["hedged"] += 1
+            return True
+
+    def call(self, func, *args):
+        """
+        `func(*args, cancel=event)`, hedged. `func` must give up once its
+        `cancel` event is set, as transport.post_json does.
+        """
+        self._count("requests")
+        if not self.enabled:
+            t1 = time.perf_counter()
+            result = func(*args, cancel=None)
+            with self._lock:
+                self.latencies.append(time.perf_counter() - t1)
+            return result
+
+        results = queue.Queue()
+        cancels = {}
+
+        def attempt(name):
+            t1 = time.perf_counter()
+            try:
+                value, error = func(*args, cancel=cancels[name]), None
+            except Exception as e:
+                value, error = None, e
+            results.put((name, value, error, time.perf_counter() - t1))
+
+        def launch(name):
+            cancels[name] = threading.Event()
+            thread = threading.Thread(target=tracing.in_context(attempt), args=(name,), name=f"image-{name}", daemon=True)
+            thread.start()
+
+        delay = self.delay()
+        launch("primary")
+        outstanding = 1
+        try:
+            name, value, error, seconds = results.get(timeout=delay)
+        except queue.Empty:
+            if self._reserve():
+                logger.info(f"No image after {delay:.1f} seconds; sending a hedged duplicate")
+                launch("hedge")
+                outstanding += 1
+            name, value, error, seconds = results.get()
+        outstanding -= 1
+
+        # If the first to finish failed, the other may still succeed
+        while error is not None and outstanding:
+            name, value, error, seconds = results.get()
+            outstanding -= 1
+
+        for other, cancel in cancels.items():
+            if other != name:
+                cancel.set()
+
+        tracing.annotate(hedged="hedge" in cancels, winner=name)
+        if error is not None:
+            raise error
+
+        with self._lock:
+            self.latencies.append(seconds)
+        if "hedge" in cancels:
+            self._count("hedge_won" if name == "hedge" else "primary_won")
+            logger.info(f"Hedged image request: the {name} answered first [{seconds:.2f} seconds]")
+        return value
+
+    def save(self) -> dict:
+        """Add this run's latencies and counters to STATS_PATH; returns the lifetime stats."""
+        with _stats_lock:
+            stats = load_stats()
+            stats["latencies"] = (stats["latencies"] + self.latencies)[-HISTORY_SIZE:]
+            for name in COUNTERS:
+                stats["counters"][name] += self.counters[name]
+            STATS_PATH.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = STATS_PATH.with_suffix(f".{threading.get_ident()}.tmp")
+            with open(tmp_path, "w") as f:
+                json.dump(stats, f)
+            os.replace(tmp_path, STATS_PATH)
+        return stats
+
+    def log_summary(self) -> None:
+        stats = self.save()
+        if not self.enabled or not self.counters["requests"]:
+            return
+        lifetime = stats["counters"]
+        logger.info(
+            f"Hedging: {self.counters['hedged']} of {self.counters['requests']} image request(s) hedged, "
+            f"hedge won {self.counters['hedge_won']}; lifetime {lifetime['hedged']} hedged, "
+            f"hedge won {lifetime['hedge_won']}, original won {lifetime['primary_won']}"
+        )
@@ -0,0 +1,156 @@
+"""
+Shared SFTP connection to the web host, for everything that uploads.
+
+One SSH connection and SFTP session is opened on first use and kept for the
+life of the process, so promote.py pays for the handshake and password auth
+once per run instead of once per file. The daemon (and a backfill's
+concurrent dates) share the same connection across runs. If the host drops it,
+the next operation reconnects and tries again once.
+
+asyncssh connections belong to the event loop that opened them, and each
+promote run is its own `asyncio.run()`. The connection therefore lives on a
+background loop thread of its own, and `call()` hands each operation to that
+loop from whichever loop the caller is running.
+
+Remote directories already made (or found) are remembered, so `makedirs` is
+attempted once per directory rather than once per file.
+"""
+
+import asyncio
+import logging
+import threading
+import time
+
+import asyncssh
+
+from constants import (
+    AICALART_SFTP_PASSWORD,
+    AICALART_SFTP_PORT,
+    AICALART_SFTP_SERVER,
+    AICALART_SFTP_USERNAME,
+    SFTP_KEEPALIVE_INTERVAL,
+)
+
+logger = logging.getLogger(__name__)
+
+# Raised when the connection under an operation went away; worth one reconnect
+_DROPPED = (asyncssh.DisconnectError, asyncssh.ChannelOpenError, asyncssh.SFTPConnectionLost, ConnectionError)
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+def configured() -> bool:
+    return all([AICALART_SFTP_SERVER, AICALART_SFTP_USERNAME, AICALART_SFTP_PASSWORD])
+
+
+class SFTPManager:
+    """The process-wide SSH connection and SFTP session to the web host."""
+
+    def __init__(self, keepalive_interval: float = SFTP_KEEPALIVE_INTERVAL):
+        self.keepalive_interval = keepalive_interval
+        self.connections_opened = 0
+        self._conn = None
+        self._sftp = None
+        self._dirs = set()
+        self._loop = None
+        self._connect_lock = None
+        self._loop_lock = threading.Lock()
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        with self._loop_lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="sftp", daemon=True).start()
+                self._loop = loop
+            return self._loop
+
+    async def _session(self) -> asyncssh.SFTPClient:
+        # Runs on the manager's own loop, so the lock is only ever awaited there
+        if self._connect_lock is None:
+            self._connect_lock = asyncio.Lock()
+        async with self._connect_lock:
+            if self._sftp is None or self._conn.is_closed():
+                t1 = time.perf_counter()
+                self._conn = await asyncssh.connect(
+                    AICALART_SFTP_SERVER,
+                    port=AICALART_SFTP_PORT,
+                    username=AICALART_SFTP_USERNAME,
+                    password=AICALART_SFTP_PASSWORD,
+                    known_hosts=None,
+                    keepalive_interval=self.keepalive_interval,
+                )
+                self._sftp = await self._conn.start_sftp_client()
+                self.connections_opened += 1
+                logger.info(f"Connected to {AICALART_SFTP_SERVER} over SFTP. [{time.perf_counter() - t1:.2f} seconds]")
+            return self._sftp
+
+    def _drop(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
+        self._conn = self._sftp = None
+        # What was there may not be any more, for all we know
+        self._dirs.clear()
+
+    async def _run(self, func, *args):
+        for attempt in range(2):
+            sftp = await self._session()
+            try:
+                return await func(sftp, *args)
+            except _DROPPED as e:
+                self._drop()
+                if attempt:
+                    raise
+                logger.warning(f"SFTP connection dropped ({e}); reconnecting")
+
+    async def call(self, func, *args):
+        """`await func(sftp, *args)` on the shared session, from any event loop or thread."""
+        future = asyncio.run_coroutine_threadsafe(self._run(func, *args), self._ensure_loop())
+        return await asyncio.wrap_future(future)
+
+    async def _makedirs(self, sftp: asyncssh.SFTPClient, remote_dir: str) -> None:
+        if not remote_dir or remote_dir in self._dirs:
+            return
+        try:
+            await sftp.makedirs(remote_dir, exist_ok=True)
+        except asyncssh.SFTPError as e:
+            # Hosts that hide the parents of a writable directory refuse this; the upload may still work
+            logger.debug(f"Could not make {remote_dir}: {e}")
+        self._dirs.add(remote_dir)
+
+    async def makedirs(self, remote_dir: str) -> None:
+        await self.call(self._makedirs, remote_dir)
+
+    async def put(self, local_path: str, remote_path: str, **kwargs) -> None:
+        """Upload `local_path` to `remote_path`, making its directory first if it isn't known to exist."""
+
+        async def upload(sftp):
+            await self._makedirs(sftp, remote_path.rsplit("/", 1)[0] if "/" in remote_path else "")
+            await sftp.put(local_path, remote_path, **kwargs)
+
+        await self.call(upload)
+
+    def warm(self) -> None:
+        """Open the connection now, from synchronous code, so the next upload doesn't wait for it."""
+        asyncio.run_coroutine_threadsafe(self._session(), self._ensure_loop()).result()
+
+    def close(self) -> None:
+        if self._loop is None:
+            return
+        asyncio.run_coroutine_threadsafe(self._close(), self._loop).result()
+
+    async def _close(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
+            await self._conn.wait_closed()
+        self._conn = self._sftp = None
+        self._dirs.clear()
+
+
+def get_manager() -> SFTPManager:
+    """Return the process-wide SFTPManager, creating it on first use."""
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = SFTPManager()
+        return _manager
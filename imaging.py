@@ -0,0 +1,200 @@
+"""
+Image decoding and encoding helpers for generated art.
+
+OpenRouter hands each image back as a base64 data URL inside the JSON body, and
+at 2K that string runs to several megabytes. Rather than slicing off the header
+(a full copy), decoding the whole payload to bytes (another) and wrapping that
+in BytesIO (a third), the payload is decoded a fixed-size window at a time
+into a buffer sized for it up front, and Pillow reads the file from that
+buffer in place. (Pillow's incremental ImageFile.Parser can't decode PNG, what
+the model returns, as it arrives; it just joins up everything it's fed.) Only
+the data URL, the decoded file and the pixels are ever alive at once, and the
+decoded file is let go as soon as the pixels are loaded, before the WebP
+encoder makes its own copy of them.
+
+Smaller copies for smaller screens are then encoded from the saved WebP in a
+pool of worker processes, so the resizes for both orientations run on separate
+cores instead of one after another under the GIL. The same pool makes each
+image's placeholder, a tiny WebP small enough to inline in the prompt JSON as a
+data URL.
+"""
+
+import base64
+import binascii
+import io
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from PIL import Image
+
+from constants import IMAGE_DERIVATIVE_WIDTHS, IMAGE_DERIVATIVE_WORKERS, IMAGE_PLACEHOLDER_WIDTH
+
+# Detail is blurred away on the site anyway, so the placeholder can be rough
+PLACEHOLDER_QUALITY = 40
+
+# Characters of base64 decoded per step; a multiple of 4 so every window ends
+# on a quantum boundary. 1 MiB of text is 768 KiB of image bytes.
+DECODE_CHUNK_CHARS = 1 << 20
+
+
+def _payload_start(data_url: str) -> int:
+    """Index of the first base64 character, skipping any `data:...;base64,` header."""
+    if data_url.startswith("data:"):
+        return data_url.index(",") + 1
+    return 0
+
+
+def iter_data_url_bytes(data_url: str, chunk_chars: int = DECODE_CHUNK_CHARS):
+    """Yield the decoded bytes of a base64 data URL (or bare base64) one window at a time."""
+    for offset in range(_payload_start(data_url), len(data_url), chunk_chars):
+        yield binascii.a2b_base64(data_url[offset:offset + chunk_chars])
+
+
+def decode_data_url(data_url: str) -> tuple:
+    """
+    Decode a base64 data URL into a new buffer sized for it up front; returns
+    (buffer, bytes used).
+
+    The buffer is allocated per call rather than kept per thread and reused:
+    open_data_url lets it go before the WebP encoder runs, and a reused one
+    would stay alive through that peak, for every thread, between images too.
+    """
+    # Three bytes per four characters is an upper bound; padding makes it a little less
+    buffer = bytearray((len(data_url) - _payload_start(data_url)) * 3 // 4)
+    size = 0
+    for chunk in iter_data_url_bytes(data_url):
+        buffer[size:size + len(chunk)] = chunk
+        size += len(chunk)
+    return buffer, size
+
+
+class BufferReader(io.RawIOBase):
+    """A read-only file over the first `size` bytes of `buffer`, without copying them as BytesIO would."""
+
+    def __init__(self, buffer: bytearray, size: int):
+        self._view = memoryview(buffer)[:size]
+        self._position = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        count = max(0, min(len(b), len(self._view) - self._position))
+        b[:count] = self._view[self._position:self._position + count]
+        self._position += count
+        return count
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self._position, io.SEEK_END: len(self._view)}[whence]
+        self._position = max(0, base + offset)
+        return self._position
+
+    def tell(self) -> int:
+        return self._position
+
+    def close(self) -> None:
+        # Let the buffer go now, even though the image keeps a reference to this reader
+        if self._view is not None:
+            self._view.release()
+            self._view = None
+        super().close()
+
+
+def open_data_url(data_url: str) -> Image.Image:
+    """
+    Decode a base64 data URL into a loaded PIL image, reading the file from a
+    single buffer that's freed once the pixels are loaded, before any encoding.
+    """
+    with BufferReader(*decode_data_url(data_url)) as reader:
+        image = Image.open(reader)
+        image.load()
+    return image
+
+
+def save_webp(data_url: str, path: str) -> int:
+    """Decode `data_url`, write it to `path` as WebP and return the file size in bytes."""
+    image = open_data_url(data_url)
+    try:
+        image.save(path, format="webp")
+    finally:
+        image.close()
+    return os.path.getsize(path)
+
+
+def derivative_path(path: str, width: int) -> str:
+    """Where the `width` pixel wide copy of `path` goes: portrait-{stamp}.webp -> portrait-{stamp}-640w.webp"""
+    root, ext = os.path.splitext(path)
+    return f"{root}-{width}w{ext}"
+
+
+def _encode_derivative(source: str, width: int, path: str) -> int:
+    with Image.open(source) as image:
+        height = round(image.height * width / image.width)
+        image.resize((width, height), Image.Resampling.LANCZOS).save(path, format="webp")
+    return os.path.getsize(path)
+
+
+def _encode_placeholder(source: str, width: int) -> str:
+    with Image.open(source) as image:
+        height = max(1, round(image.height * width / image.width))
+        buffer = io.BytesIO()
+        image.resize((width, height), Image.Resampling.BOX).save(buffer, format="webp", quality=PLACEHOLDER_QUALITY)
+    return f"data:image/webp;base64,{base64.b64encode(buffer.getvalue()).decode('ascii')}"
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    # One pool per process, shared by every day of a backfill. Spawned rather
+    # than forked: the parent has threads (and their locks) in flight.
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=IMAGE_DERIVATIVE_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return _pool
+
+
+def build_derivatives(
+    sources: list,
+    widths: list = IMAGE_DERIVATIVE_WIDTHS,
+    placeholder_width: int = IMAGE_PLACEHOLDER_WIDTH,
+) -> dict:
+    """
+    Encode a copy of each WebP in `sources` at each of `widths`, alongside it,
+    and a `placeholder_width` pixel wide placeholder.
+
+    Widths at or above a source's own are skipped. Returns, per source, its
+    "width" and "height", the sorted derivative widths written ("variants") and
+    the "placeholder" data URL, plus the "bytes" written per width.
+    """
+    jobs = {}
+    placeholders = {}
+    results = {}
+    for source in sources:
+        with Image.open(source) as image:
+            full_width, full_height = image.size
+        results[source] = {"width": full_width, "height": full_height, "variants": [], "bytes": {}}
+        if placeholder_width:
+            placeholders[source] = _get_pool().submit(_encode_placeholder, source, placeholder_width)
+        for width in sorted(set(widths)):
+            if width < full_width:
+                jobs[(source, width)] = _get_pool().submit(
+                    _encode_derivative, source, width, derivative_path(source, width)
+                )
+
+    for (source, width), future in jobs.items():
+        results[source]["bytes"][width] = future.result()
+        results[source]["variants"].append(width)
+    for source, future in placeholders.items():
+        results[source]["placeholder"] = future.result()
+    return results
@@ -0,0 +1,223 @@
+"""
+Local SQLite ledger of every generate.py and promote.py run.
+
+Each `generate.main` and `promote.main` adds one row to cache/ledger.sqlite3
+when it finishes. The row is built from the run's tracing spans (see
+tracing.py): the date, style and models, how many image attempts and which
+fallback level it took, how long each stage ran, the bytes downloaded, saved
+and uploaded, each upload's duration, and whether it succeeded.
+
+`python ledger.py` reports p50/p95 latencies, failure rates by model and a
+week-by-week trend, for spotting regressions and slow providers:
+
+    python ledger.py --days 90 --kind generate
+"""
+
+import argparse
+import datetime
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import defaultdict
+from pathlib import Path
+
+from colorama import Fore, Style
+
+import tracing
+from hedge import percentile
+
+logger = logging.getLogger(__name__)
+
+LEDGER_PATH = Path(__file__).parent / "cache" / "ledger.sqlite3"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    date TEXT,
+    started_at REAL NOT NULL,
+    seconds REAL NOT NULL,
+    status TEXT NOT NULL,
+    style TEXT,
+    text_model TEXT,
+    image_model TEXT,
+    attempts INTEGER,
+    fallback_level INTEGER,
+    image_bytes INTEGER,
+    saved_bytes INTEGER,
+    uploaded_bytes INTEGER,
+    upload_seconds REAL,
+    stages TEXT NOT NULL,
+    uploads TEXT NOT NULL,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS runs_by_start ON runs (kind, started_at);
+"""
+
+_write_lock = threading.Lock()
+
+
+def _connect(path: Path | None = None) -> sqlite3.Connection:
+    path = path or LEDGER_PATH
+    path.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(path)
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def summarize(kind: str, trace, event: dict) -> dict:
+    """A ledger row for the run whose own span is `event`, from every span inside it."""
+    attrs = event["args"]
+    spans = [e for e in trace.within(event) if e is not event]
+
+    # Wall-clock time per stage, so concurrent spans (uploads) aren't counted twice
+    stages = defaultdict(list)
+    for span in spans:
+        stages[span["name"]].append(span)
+
+    def spans_named(*prefixes):
+        return [span for span in spans if span["name"].startswith(prefixes)]
+
+    prompts = spans_named("prompt")
+    images = [span for span in spans if span["name"] == "images"]
+    image_models = {span["args"].get("model") for span in spans_named("image.")} - {None}
+    uploads = [
+        {
+            "remote_path": span["args"].get("remote_path"),
+            "bytes": span["args"].get("bytes", 0),
+            "seconds": round(span["dur"] / 1_000_000, 3),
+            "error": span["args"].get("error"),
+        }
+        for span in spans
+        if span["name"] == "upload"
+    ]
+
+    if attrs.get("error"):
+        status = "error"
+    else:
+        status = "ok" if attrs.get("succeeded") else "failed"
+
+    return {
+        "kind": kind,
+        "date": attrs.get("date"),
+        "started_at": trace.started_at + event["ts"] / 1_000_000,
+        "seconds": event["dur"] / 1_000_000,
+        "status": status,
+        "style": attrs.get("style"),
+        "text_model": prompts[-1]["args"].get("model") if prompts else None,
+        "image_model": ",".join(sorted(image_models)) or attrs.get("model"),
+        # Rounds of image requests, across retries and fallback levels
+        "attempts": sum(span["args"].get("retries", 0) + 1 for span in images) if images else None,
+        "fallback_level": max((span["args"].get("fallback_level", 0) for span in prompts), default=None),
+        "image_bytes": sum(span["args"].get("bytes", 0) for span in spans_named("image.")),
+        "saved_bytes": sum(span["args"].get("bytes", 0) for span in spans_named("save.", "derivatives")),
+        "uploaded_bytes": sum(upload["bytes"] for upload in uploads if not upload["error"]),
+        "upload_seconds": round(tracing.wall_seconds(stages["upload"]), 3) if uploads else 0.0,
+        "stages": json.dumps({name: round(tracing.wall_seconds(events), 3) for name, events in stages.items()}),
+        "uploads": json.dumps(uploads),
+        "error": attrs.get("error"),
+    }
+
+
+def recorder(kind: str):
+    """An `on_finish` callback for tracing.run that adds the run to the ledger."""
+
+    def record(trace, event):
+        row = summarize(kind, trace, event)
+        with _write_lock:
+            conn = _connect()
+            try:
+                with conn:
+                    conn.execute(
+                        f"INSERT INTO runs ({', '.join(row)}) VALUES ({', '.join('?' * len(row))})",
+                        tuple(row.values()),
+                    )
+            finally:
+                conn.close()
+
+    return record
+
+
+def load_runs(days: float, kind: str | None = None, path: Path | None = None) -> list:
+    """Runs that started in the last `days` days, oldest first, as dicts."""
+    conn = _connect(path)
+    conn.row_factory = sqlite3.Row
+    try:
+        query = "SELECT * FROM runs WHERE started_at >= ?"
+        params = [time.time() - days * 86400]
+        if kind:
+            query += " AND kind = ?"
+            params.append(kind)
+        rows = conn.execute(query + " ORDER BY started_at", params).fetchall()
+    finally:
+        conn.close()
+    return [dict(row) for row in rows]
+
+
+def _latencies(runs: list) -> str:
+    seconds = [run["seconds"] for run in runs]
+    if not seconds:
+        return f"{'-':>9}{'-':>9}"
+    return f"{percentile(seconds, 50):>9.1f}{percentile(seconds, 95):>9.1f}"
+
+
+def _failure_rate(runs: list) -> str:
+    failed = sum(run["status"] != "ok" for run in runs)
+    rate = failed / len(runs) if runs else 0.0
+    colour = Fore.RED if rate > 0.2 else ""
+    return f"{colour}{rate:>9.0%}{Style.RESET_ALL}"
+
+
+def report(runs: list) -> None:
+    if not runs:
+        print("No runs recorded in that window.")
+        return
+
+    for kind in sorted({run["kind"] for run in runs}):
+        kind_runs = [run for run in runs if run["kind"] == kind]
+        ok_runs = [run for run in kind_runs if run["status"] == "ok"]
+        print(f"\n{Fore.CYAN}{kind}{Style.RESET_ALL}: {len(kind_runs)} run(s), {len(kind_runs) - len(ok_runs)} failed")
+
+        print(f"\n{'stage (successful runs)':<32}{'p50 s':>9}{'p95 s':>9}")
+        print(f"{'total':<32}{_latencies(ok_runs)}")
+        stage_seconds = defaultdict(list)
+        for run in ok_runs:
+            for name, seconds in json.loads(run["stages"]).items():
+                stage_seconds[name].append(seconds)
+        for name in sorted(stage_seconds):
+            values = stage_seconds[name]
+            print(f"{name:<32}{percentile(values, 50):>9.1f}{percentile(values, 95):>9.1f}")
+
+        by_model = defaultdict(list)
+        for run in kind_runs:
+            if run["image_model"]:
+                by_model[run["image_model"]].append(run)
+        if by_model:
+            print(f"\n{'image model':<48}{'runs':>6}{'failed':>9}{'p50 s':>9}{'p95 s':>9}")
+            for model, model_runs in sorted(by_model.items()):
+                model_ok = [run for run in model_runs if run["status"] == "ok"]
+                print(f"{model:<48}{len(model_runs):>6}{_failure_rate(model_runs)}{_latencies(model_ok)}")
+
+        by_week = defaultdict(list)
+        for run in kind_runs:
+            started = datetime.date.fromtimestamp(run["started_at"])
+            by_week[started - datetime.timedelta(days=started.weekday())].append(run)
+        print(f"\n{'week of':<16}{'runs':>6}{'failed':>9}{'p50 s':>9}{'p95 s':>9}{'upload MiB':>12}{'fallbacks':>11}")
+        for week, week_runs in sorted(by_week.items()):
+            week_ok = [run for run in week_runs if run["status"] == "ok"]
+            uploaded = sum(run["uploaded_bytes"] or 0 for run in week_runs) / (1 << 20)
+            fallbacks = sum(1 for run in week_runs if run["fallback_level"])
+            print(
+                f"{week.isoformat():<16}{len(week_runs):>6}{_failure_rate(week_runs)}"
+                f"{_latencies(week_ok)}{uploaded:>12.1f}{fallbacks:>11}"
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Report on past generate.py and promote.py runs.")
+    parser.add_argument("--days", type=float, default=30, help="How far back to look (default: 30).")
+    parser.add_argument("--kind", choices=["generate", "promote"], default=None, help="Only this kind of run.")
+    args = parser.parse_args()
+    report(load_runs(args.days, args.kind))
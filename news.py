@@ -0,0 +1,141 @@
+"""
+Top news headlines for the daily prompt.
+
+Each feed (a country, optionally narrowed to a topic) is fetched from Google
+News and cached on disk per feed and period for NEWS_CACHE_TTL seconds. A
+backfill or a re-run therefore reuses one fetch instead of scraping the feed
+again for every date. Feeds are fetched concurrently and the whole lookup is
+bounded by NEWS_DEADLINE. A feed that doesn't answer in time (or answers with
+nothing) falls back to the last headlines it did return, however old, so a
+slow feed costs seconds rather than the minutes the socket timeout allows.
+
+gnews has no timeout of its own, so each fetch runs in a daemon thread that is
+abandoned, not waited on, once the deadline passes.
+"""
+
+import json
+import logging
+import os
+import re
+import threading
+import time
+from pathlib import Path
+
+from constants import NEWS_CACHE_TTL, NEWS_DEADLINE, NEWS_FEEDS, NEWS_PERIOD
+
+logger = logging.getLogger(__name__)
+
+CACHE_DIR = Path(__file__).parent / "cache" / "news"
+
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+
+def _cache_path(feed: str, period: str) -> Path:
+    return CACHE_DIR / f"{re.sub(r'[^A-Za-z0-9_-]+', '_', f'{feed}-{period}')}.json"
+
+
+def _read_cache(feed: str, period: str) -> tuple:
+    """(headlines, fetched_at) from the cache, or ([], 0) if there are none."""
+    try:
+        with open(_cache_path(feed, period)) as f:
+            entry = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError, IOError):
+        return [], 0
+    return entry.get("headlines", []), entry.get("fetched", 0)
+
+
+def _write_cache(feed: str, period: str, headlines: list) -> None:
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    path = _cache_path(feed, period)
+    tmp_path = path.with_suffix(f".{threading.get_ident()}.tmp")
+    with open(tmp_path, "w") as f:
+        json.dump({"fetched": time.time(), "headlines": headlines}, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def _fetch_feed(feed: str, period: str) -> list:
+    from gnews import GNews
+
+    country, _, topic = feed.partition(":")
+    gn = GNews(language="en", country=country.upper(), period=period)
+    articles = gn.get_news_by_topic(topic.upper()) if topic else gn.get_top_news()
+    return [article["title"] for article in articles if article.get("title")]
+
+
+def _refresh(feed: str, period: str) -> None:
+    try:
+        t1 = time.perf_counter()
+        headlines = _fetch_feed(feed, period)
+        if headlines:
+            _write_cache(feed, period, headlines)
+        logger.info(f"Fetched {len(headlines)} headline(s) from {feed}. [{time.perf_counter() - t1:.2f} seconds]")
+    except Exception as e:
+        logger.warning(f"Could not fetch news feed {feed}: {e}")
+    finally:
+        with _inflight_lock:
+            _inflight.pop((feed, period), None)
+
+
+def _start_refresh(feed: str, period: str) -> threading.Thread:
+    """Start fetching `feed`, or join the fetch another caller already started."""
+    with _inflight_lock:
+        thread = _inflight.get((feed, period))
+        if thread is None:
+            thread = threading.Thread(target=_refresh, args=(feed, period), name=f"news-{feed}", daemon=True)
+            _inflight[(feed, period)] = thread
+            thread.start()
+        return thread
+
+
+def _normalise(headline: str) -> str:
+    # Google News titles end in " - Publisher"; the same story from two feeds
+    # often differs only there
+    title = headline.rsplit(" - ", 1)[0]
+    return re.sub(r"\W+", " ", title).strip().lower()
+
+
+def merge_headlines(feeds: list) -> list:
+    """Interleave each feed's headlines by rank, dropping stories already seen."""
+    seen = set()
+    merged = []
+    for rank in range(max((len(headlines) for headlines in feeds), default=0)):
+        for headlines in feeds:
+            if rank >= len(headlines):
+                continue
+            key = _normalise(headlines[rank])
+            if key in seen:
+                continue
+            seen.add(key)
+            merged.append(headlines[rank])
+    return merged
+
+
+def get_headlines(
+    feeds: list | None = None,
+    period: str = NEWS_PERIOD,
+    deadline: float = NEWS_DEADLINE,
+    ttl: float = NEWS_CACHE_TTL,
+) -> list:
+    """
+    Headlines from every feed, best first and without duplicates.
+
+    Feeds cached within `ttl` seconds aren't fetched at all. The rest are
+    fetched at once, and whatever hasn't come back within `deadline` seconds is
+    served from its last cached headlines instead.
+    """
+    feeds = feeds or NEWS_FEEDS
+    start = time.perf_counter()
+
+    refreshing = {}
+    for feed in feeds:
+        _, fetched_at = _read_cache(feed, period)
+        if time.time() - fetched_at > ttl:
+            refreshing[feed] = _start_refresh(feed, period)
+
+    for feed, thread in refreshing.items():
+        thread.join(max(deadline - (time.perf_counter() - start), 0))
+        if thread.is_alive():
+            logger.warning(f"News feed {feed} took longer than {deadline:g} seconds; using its last headlines")
+
+    return merge_headlines([_read_cache(feed, period)[0] for feed in feeds])
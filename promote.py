@@ -1,14 +1,27 @@
 import argparse
+import glob
+import hashlib
+import json
 import logging
 import asyncio
+import re
 import asyncssh
+import os
 from colorama import Fore, Style
+
+import clock
+import hosting
+import ledger
+import remote_manifest
+import tracing
+from checkpoint import file_unchanged
 from constants import (
-    AICALART_SFTP_SERVER,
-    AICALART_SFTP_USERNAME,
-    AICALART_SFTP_PASSWORD,
     AICALART_IMAGES_PATH,
     AICALART_PROMPTS_PATH,
+    SFTP_BLOCK_SIZE,
+    SFTP_CONCURRENT_UPLOADS,
+    SFTP_MAX_REQUESTS,
+    SFTP_VERIFY_UPLOADS,
 )
 
 class CustomFormatter(logging.Formatter):
@@ -32,6 +45,9 @@ ch.setLevel(logging.INFO)
 ch.setFormatter(CustomFormatter())
 logger.addHandler(ch)
 
+# Uploaded-but-unpublished files for a day, as (hidden, final) remote path pairs
+PENDING_MANIFEST = "./staging/pending-{date}.json"
+
 def extract_datetime(filename):
     # Extract the part after "landscape-" or "portrait-" and keep 'Z' at the end
     datetime_part = filename.split("-", 1)[1]
@@ -39,83 +55,384 @@ def extract_datetime(filename):
     datetime_with_colons = datetime_part.replace("/", ":")
     return datetime_with_colons
 
-def adjust_to_cst(the_datetime):
-    # Convert the UTC datetime string to a datetime object
-    datetime_obj = datetime.strptime(the_datetime, "%Y-%m-%dT%H:%M:%S.%fZ")
+def find_derivatives(image_file):
+    """(width, path) for each smaller copy of `image_file` in staging (see imaging.derivative_path)."""
+    root = image_file.rsplit(".webp", 1)[0]
+    derivatives = []
+    for path in glob.glob(f"{glob.escape(root)}-*w.webp"):
+        match = re.search(r"-(\d+)w\.webp$", path)
+        if match:
+            derivatives.append((int(match.group(1)), path))
+    return sorted(derivatives)
+
+def hidden_path(remote_path):
+    """Where `remote_path` waits to be published: a dotfile the site never asks for."""
+    remote_dir, name = remote_path.rsplit("/", 1)
+    return f"{remote_dir}/.{name}.pending"
+
+def temp_path(remote_path):
+    """Where a file for `remote_path` is written before it's renamed into place."""
+    remote_dir, name = remote_path.rsplit("/", 1)
+    return f"{remote_dir}/.{name}.{os.getpid()}.tmp"
+
+class UploadMismatch(Exception):
+    """The remote copy of an upload isn't the same as the local file."""
+
+def upload_plan(date):
+    """(local, remote) pairs for a staged run, with the prompt JSON last."""
+    # Separate the date and time components for the image files
+    date_part, time_part = date.split("T")
+
+    # Construct the file paths
+    landscape_file = f"./staging/landscape-{date_part}T{time_part}.webp"
+    portrait_file = f"./staging/portrait-{date_part}T{time_part}.webp"
+    prompt_file = f"./staging/prompt-{date_part}.json"
+
+    plan = [
+        (landscape_file, f"{AICALART_IMAGES_PATH}/{date_part}-landscape.webp"),
+        (portrait_file, f"{AICALART_IMAGES_PATH}/{date_part}-portrait.webp"),
+    ]
+    for orientation, image_file in (("landscape", landscape_file), ("portrait", portrait_file)):
+        for width, derivative_file in find_derivatives(image_file):
+            plan.append((derivative_file, f"{AICALART_IMAGES_PATH}/{date_part}-{orientation}-{width}w.webp"))
+    # The site shows a day only once its prompt JSON loads, so this goes (or is renamed into place) last
+    plan.append((prompt_file, f"{AICALART_PROMPTS_PATH}/{date_part}-prompt.json"))
+    return plan
 
-    # Adjust to CST by subtracting 6 hours
-    cst_datetime_obj = datetime_obj - timedelta(hours=6)
+def alias_plan(date):
+    """
+    (alias, target, local) for the files that always point at the newest day.
+    They're made on the host from the day's own uploads (see update_aliases),
+    with `local` only as a last resort.
+    """
+    date_part, time_part = date.split("T")
+    return [
+        # for iPhone wallpaper shortcut
+        (f"{AICALART_IMAGES_PATH}/portrait.webp", f"{AICALART_IMAGES_PATH}/{date_part}-portrait.webp", f"./staging/portrait-{date_part}T{time_part}.webp"),
+        (f"{AICALART_IMAGES_PATH}/latest-landscape.webp", f"{AICALART_IMAGES_PATH}/{date_part}-landscape.webp", f"./staging/landscape-{date_part}T{time_part}.webp"),
+        (f"{AICALART_PROMPTS_PATH}/latest-prompt.json", f"{AICALART_PROMPTS_PATH}/{date_part}-prompt.json", f"./staging/prompt-{date_part}.json"),
+    ]
+
+async def _remote_sha256(sftp, remote_path):
+    digest = hashlib.sha256()
+    async with sftp.open(remote_path, "rb", block_size=SFTP_BLOCK_SIZE, max_requests=SFTP_MAX_REQUESTS) as f:
+        while chunk := await f.read(1 << 20):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+async def _put(local_path, remote_path, force=False):
+    """
+    Upload one file over the shared connection (see hosting.py) to a temporary
+    name, check the remote copy's size and (with SFTP_VERIFY_UPLOADS) SHA-256,
+    then rename it over `remote_path`, so the host never serves a partial file.
+    Skipped, unless `force`, if remote_manifest says those bytes are already
+    there. Raises if it fails.
+    """
+    size = os.path.getsize(local_path)
+    sha256 = await asyncio.to_thread(remote_manifest.file_sha256, local_path)
+    if not force and remote_manifest.unchanged(remote_path, sha256, size):
+        logger.info(f"{remote_path} is unchanged; not uploading {local_path}")
+        return
 
-    # Convert back to string to extract the date
-    cst_datetime_str = cst_datetime_obj.strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+    tmp_path = temp_path(remote_path)
 
-    return cst_datetime_str
+    async def upload(sftp):
+        await sftp.put(local_path, tmp_path, block_size=SFTP_BLOCK_SIZE, max_requests=SFTP_MAX_REQUESTS)
+        try:
+            remote_size = (await sftp.stat(tmp_path)).size
+            if remote_size != size:
+                raise UploadMismatch(f"{tmp_path} has {remote_size} bytes, expected {size}")
+            if SFTP_VERIFY_UPLOADS and await _remote_sha256(sftp, tmp_path) != sha256:
+                raise UploadMismatch(f"{tmp_path} doesn't match the SHA-256 of {local_path}")
+            await replace_remote(sftp, tmp_path, remote_path)
+        except BaseException:
+            try:
+                await sftp.remove(tmp_path)
+            except Exception:
+                # Gone already, or with the connection; a later upload overwrites it
+                pass
+            raise
+
+    with tracing.span("upload", local_path=local_path, remote_path=remote_path) as span:
+        span.set(bytes=size)
+        manager = hosting.get_manager()
+        await manager.makedirs(remote_path.rsplit("/", 1)[0])
+        await manager.call(upload)
+        remote_manifest.record(remote_path, sha256, size)
+        logger.info(f"Uploaded {local_path} to {remote_path}")
 
 async def upload_file_via_sftp(local_path, remote_path):
-    """Upload a file to web hosting via SFTP."""
-    if not all([AICALART_SFTP_SERVER, AICALART_SFTP_USERNAME, AICALART_SFTP_PASSWORD]):
+    """Upload a file to web hosting via SFTP. Returns whether it was uploaded."""
+    if not hosting.configured():
         logger.error("Web hosting credentials not configured")
-        return
+        return False
     
     try:
-        async with asyncssh.connect(
-            AICALART_SFTP_SERVER,
-            username=AICALART_SFTP_USERNAME,
-            password=AICALART_SFTP_PASSWORD,
-            known_hosts=None
-        ) as conn:
-            async with conn.start_sftp_client() as sftp:
-                # Ensure remote directory exists
-                remote_dir = "/".join(remote_path.rsplit("/", 1)[:-1])
-                try:
-                    await sftp.makedirs(remote_dir)
-                except:
-                    pass  # Directory might already exist
-                
-                await sftp.put(local_path, remote_path)
-                logger.info(f"Uploaded {local_path} to {remote_path}")
+        await _put(local_path, remote_path)
+        return True
     except FileNotFoundError:
         logger.error(f"The file was not found: {local_path}")
     except Exception as e:
         logger.error(f"Error uploading {local_path} via SFTP: {e}")
+    return False
+
+async def upload_files(pairs, concurrency=SFTP_CONCURRENT_UPLOADS, on_uploaded=None, force=False):
+    """
+    Upload (local, remote) pairs side by side over the shared session, at most
+    `concurrency` at a time (see _put). Calls `on_uploaded(local, remote)` as
+    each one finishes; returns {remote: error} for every one that failed.
+    """
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def upload(local_path, remote_path):
+        async with semaphore:
+            await _put(local_path, remote_path, force=force)
+        if on_uploaded:
+            on_uploaded(local_path, remote_path)
+
+    results = await asyncio.gather(*(upload(local, remote) for local, remote in pairs), return_exceptions=True)
+    return {remote: result for (_, remote), result in zip(pairs, results) if isinstance(result, BaseException)}
+
+def log_failures(failures, total):
+    logger.error(f"{len(failures)} of {total} remote file(s) failed:")
+    for remote_path, error in failures.items():
+        logger.error(f"  {remote_path}: {error}")
 
 async def upload_directory_via_sftp(local_dir, remote_dir):
     """Upload a directory recursively to web hosting via SFTP."""
-    if not all([AICALART_SFTP_SERVER, AICALART_SFTP_USERNAME, AICALART_SFTP_PASSWORD]):
+    if not hosting.configured():
         logger.error("Web hosting credentials not configured")
         return
     
     try:
-        async with asyncssh.connect(
-            AICALART_SFTP_SERVER,
-            username=AICALART_SFTP_USERNAME,
-            password=AICALART_SFTP_PASSWORD,
-            known_hosts=None
-        ) as conn:
-            async with conn.start_sftp_client() as sftp:
-                await sftp.put(local_dir, remote_dir, recurse=True, preserve=True)
-                logger.info(f"Uploaded directory {local_dir} to {remote_dir}")
+        await hosting.get_manager().put(local_dir, remote_dir, recurse=True, preserve=True)
+        logger.info(f"Uploaded directory {local_dir} to {remote_dir}")
     except Exception as e:
         logger.error(f"Error uploading directory {local_dir} via SFTP: {e}")
 
-async def main(date):
-    # Separate the date and time components for the image files
-    date_part, time_part = date.split("T")
+async def replace_remote(sftp, src, dst):
+    """Rename `src` over `dst` in one step, so nothing ever sees `dst` missing or half-written."""
+    try:
+        await sftp.posix_rename(src, dst)
+    except asyncssh.SFTPOpUnsupported:
+        # Plain SFTP rename won't overwrite; there's a brief gap where `dst` is missing
+        logger.warning(f"Server can't replace files atomically; removing {dst} before renaming")
+        try:
+            await sftp.remove(dst)
+        except asyncssh.SFTPNoSuchFile:
+            pass
+        await sftp.rename(src, dst)
 
-    # Construct the file paths
-    landscape_file = f"./staging/landscape-{date_part}T{time_part}.webp"
-    portrait_file = f"./staging/portrait-{date_part}T{time_part}.webp"
-    prompt_file = f"./staging/prompt-{date_part}.json"
+# Ways of making an alias on the host, cheapest first; ones it turns out not to
+# support aren't tried again. If none work, the local copy goes up through _put.
+ALIAS_METHODS = ("hardlink", "copy")
+_unsupported_alias_methods = set()
+
+async def _make_alias(sftp, alias, target):
+    """Point `alias` at a copy of `target` made on the host, swapped in atomically. Returns the method that worked."""
+    tmp_path = temp_path(alias)
+    makers = {
+        # Same file, no bytes moved; the link keeps yesterday's content alive after `alias` moves on
+        "hardlink": lambda: sftp.link(target, tmp_path),
+        # Copied on the host with the copy-data extension
+        "copy": lambda: sftp.copy(target, tmp_path, remote_only=True),
+    }
+    error = asyncssh.SFTPOpUnsupported("No way of making aliases on the host")
+    for method in ALIAS_METHODS:
+        if method in _unsupported_alias_methods:
+            continue
+        try:
+            # Left over from an interrupted run, it would block the link
+            await sftp.remove(tmp_path)
+        except asyncssh.SFTPError:
+            pass
+        try:
+            await makers[method]()
+        except asyncssh.SFTPOpUnsupported as e:
+            _unsupported_alias_methods.add(method)
+            error = e
+            continue
+        except asyncssh.SFTPError as e:
+            logger.debug(f"Could not {method} {target} to {alias}: {e}")
+            error = e
+            continue
+        await replace_remote(sftp, tmp_path, alias)
+        # Renaming a hard link over another link to the same file does nothing,
+        # so when the alias already pointed at this day the temp name is still there
+        try:
+            await sftp.remove(tmp_path)
+        except asyncssh.SFTPNoSuchFile:
+            pass
+        return method
+    raise error
+
+async def update_aliases(date_part, aliases):
+    """
+    Point each alias at the day's file, unless `date_part` isn't today (a
+    backfill, or a staged day published late), so they only ever show the
+    current day. Aliases the host can't make from the day's file are uploaded
+    from `local` through _put, checked like any other upload. Returns
+    {alias: error} for the ones that couldn't be updated.
+    """
+    if date_part != clock.today():
+        logger.info(f"Leaving the latest-day aliases alone for {date_part}, which isn't today")
+        return {}
+
+    failures = {}
+    uploads = {}
+
+    async def make_all(sftp):
+        for alias, target, local_path in aliases:
+            with tracing.span("alias", alias=alias, target=target) as span:
+                try:
+                    method = await _make_alias(sftp, alias, target)
+                except asyncssh.SFTPError as e:
+                    logger.debug(f"Could not make {alias} on the host ({e}); uploading {local_path}")
+                    uploads[alias] = local_path
+                    continue
+                except OSError as e:
+                    failures[alias] = e
+                    continue
+                span.set(method=method)
+                # In case it failed on a connection that has since been replaced
+                failures.pop(alias, None)
+                uploads.pop(alias, None)
+                logger.info(f"Pointed {alias} at {target} ({method})")
+
+    try:
+        await hosting.get_manager().call(make_all)
+    except Exception as e:
+        failures.update({alias: e for alias, _, _ in aliases if alias not in failures and alias not in uploads})
+
+    for alias, local_path in uploads.items():
+        with tracing.span("alias", alias=alias, method="upload"):
+            try:
+                # Forced: aliases made on the host aren't in remote_manifest, so its entry may be stale
+                await _put(local_path, alias, force=True)
+            except Exception as e:
+                failures[alias] = e
+    return failures
+
+async def publish(date_part):
+    """Put a day uploaded by `main(..., hidden=True)` live, renaming each file into place with the prompt JSON last."""
+    manifest_path = PENDING_MANIFEST.format(date=date_part)
+    try:
+        with open(manifest_path) as f:
+            pending = json.load(f)
+    except FileNotFoundError:
+        logger.error(f"Nothing staged to publish for {date_part}")
+        return False
+
+    async def rename_all(sftp):
+        for hidden, final in pending["files"]:
+            try:
+                await replace_remote(sftp, hidden, final)
+            except asyncssh.SFTPNoSuchFile:
+                # Already renamed by an earlier, interrupted publish
+                if not await sftp.exists(final):
+                    raise
+
+    try:
+        with tracing.span("publish", date=date_part, files=len(pending["files"])):
+            await hosting.get_manager().call(rename_all)
+    except Exception as e:
+        logger.error(f"Error publishing {date_part}: {e}")
+        return False
+    remote_manifest.move(pending["files"])
+
+    failures = await update_aliases(date_part, pending.get("aliases", []))
+    if failures:
+        log_failures(failures, len(pending["aliases"]))
+        return False
+    os.remove(manifest_path)
+    logger.info(f"Published {date_part}")
+    return True
+
+async def main(date, hidden=False, checkpoint=None, force=False):
+    """
+    Upload a staged run, several files at once (see upload_files). With
+    `hidden`, every file goes up under its hidden_path and waits for publish().
+    Returns whether all of them made it; the ones that didn't are logged together.
+
+    With a `checkpoint` (see checkpoint.py), each finished upload is recorded and
+    files already uploaded, and unchanged since, are skipped. Files the host
+    already has byte for byte (see remote_manifest.py) are skipped too, unless `force`.
+    """
+    date_part = date.split("T")[0]
+    plan = upload_plan(date)
+
+    if not hosting.configured():
+        logger.error("Web hosting credentials not configured")
+        return False
+
+    targets = [(local, hidden_path(remote) if hidden else remote) for local, remote in plan]
+    done = (checkpoint.load("uploads") or {}) if checkpoint else {}
+    pending = []
+    for local_path, target in targets:
+        if target in done and file_unchanged(local_path, done[target]):
+            logger.info(f"Already uploaded {local_path} to {target}")
+        else:
+            pending.append((local_path, target))
+
+    def record(local_path, target):
+        if checkpoint:
+            checkpoint.update("uploads", target, os.path.getsize(local_path))
 
-    # Upload the files to hosting
-    await upload_file_via_sftp(landscape_file, f"{AICALART_IMAGES_PATH}/{date_part}-landscape.webp")
-    await upload_file_via_sftp(portrait_file, f"{AICALART_IMAGES_PATH}/{date_part}-portrait.webp")
-    await upload_file_via_sftp(portrait_file, f"{AICALART_IMAGES_PATH}/portrait.webp")  # for iPhone wallpaper shortcut
-    await upload_file_via_sftp(prompt_file, f"{AICALART_PROMPTS_PATH}/{date_part}-prompt.json")
+    # Part of generate.py's trace when called from there, otherwise a trace of its own
+    with tracing.run(
+        "promote",
+        f"./staging/trace-promote-{date}.json",
+        on_finish=ledger.recorder("promote"),
+        date=date_part,
+        hidden=hidden,
+    ) as run_span:
+        # The images go up together; the prompt JSON only once they've all made it,
+        # since the site shows a day as soon as its JSON is there
+        prompt_upload = targets[-1]
+        failures = await upload_files(
+            [pair for pair in pending if pair != prompt_upload], on_uploaded=record, force=force
+        )
+        if prompt_upload in pending:
+            if failures:
+                failures[prompt_upload[1]] = "not uploaded, since the images above failed"
+            else:
+                failures = await upload_files([prompt_upload], on_uploaded=record, force=force)
+        # Hidden days get their aliases when they're published
+        if not failures and not hidden:
+            failures = await update_aliases(date_part, alias_plan(date))
+        run_span.set(succeeded=not failures, failed=len(failures))
 
+    if failures:
+        log_failures(failures, len(targets) + len(alias_plan(date)))
+        return False
+    if hidden:
+        with open(PENDING_MANIFEST.format(date=date_part), "w") as f:
+            json.dump(
+                {
+                    "date": date_part,
+                    "files": [(hidden_path(remote), remote) for _, remote in plan],
+                    "aliases": alias_plan(date),
+                },
+                f,
+                indent=4,
+            )
+        logger.info(f"Uploaded {date_part} under hidden names; publish it with: python promote.py --publish {date_part}")
+    return True
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Upload daily files to web hosting.")
     parser.add_argument("date", type=str, help="Date for the files to upload (format: YYYY-MM-DD)")
+    parser.add_argument("--hidden", action="store_true", help="Upload under hidden names, to be put live later with --publish.")
+    parser.add_argument("--publish", action="store_true", help="Put a day uploaded with --hidden live (date as YYYY-MM-DD).")
+    parser.add_argument("--force", action="store_true", help="Upload even files the host already has unchanged.")
     args = parser.parse_args()
-    asyncio.run(main(args.date))
+    stamp = args.date
+    # Accept a filename as Finder shows it, e.g. portrait-2023-12-03T05/04/58.791456Z
+    if stamp.startswith(("landscape-", "portrait-")):
+        stamp = extract_datetime(stamp)
+    if args.publish:
+        succeeded = asyncio.run(publish(stamp.split("T")[0]))
+    else:
+        succeeded = asyncio.run(main(stamp, hidden=args.hidden, force=args.force))
+    if not succeeded:
+        exit(1)
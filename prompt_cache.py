@@ -0,0 +1,89 @@
+"""
+Content-addressed on-disk cache for generate_prompt completions.
+
+Entries are keyed by a SHA-256 of the model name and the exact chat messages,
+so re-running a date with the same style and context (say, to try another image
+model with --model) reuses the prompt instead of paying for another LLM round
+trip. Entries expire after PROMPT_CACHE_TTL seconds, and once the directory
+grows past PROMPT_CACHE_MAX_BYTES the least recently used entries are dropped.
+"""
+
+import hashlib
+import json
+import os
+import time
+from pathlib import Path
+
+from constants import PROMPT_CACHE_MAX_BYTES, PROMPT_CACHE_TTL
+
+CACHE_DIR = Path(__file__).parent / "cache" / "prompts"
+
+
+def cache_key(model: str, messages: list) -> str:
+    """Hash of everything that determines the completion."""
+    payload = json.dumps({"model": model, "messages": messages}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _entry_path(key: str) -> Path:
+    return CACHE_DIR / f"{key}.json"
+
+
+def get(key: str, ttl: float = PROMPT_CACHE_TTL) -> str | None:
+    """Return the cached completion for `key`, or None if missing or expired."""
+    path = _entry_path(key)
+    try:
+        with open(path) as f:
+            entry = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError, IOError):
+        return None
+
+    if time.time() - entry.get("created", 0) > ttl:
+        path.unlink(missing_ok=True)
+        return None
+
+    # The file's mtime doubles as its last-used time for LRU eviction
+    os.utime(path)
+    return entry.get("content")
+
+
+def put(key: str, model: str, content: str, max_bytes: int = PROMPT_CACHE_MAX_BYTES) -> None:
+    """Store a completion, then evict old entries if the cache is over budget."""
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    path = _entry_path(key)
+    tmp_path = path.with_suffix(".tmp")
+    with open(tmp_path, "w") as f:
+        json.dump({"model": model, "created": time.time(), "content": content}, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+    evict(max_bytes)
+
+
+def evict(max_bytes: int = PROMPT_CACHE_MAX_BYTES) -> int:
+    """Delete least recently used entries until the cache fits in `max_bytes`. Returns how many went."""
+    if not CACHE_DIR.exists():
+        return 0
+
+    entries = []
+    for path in CACHE_DIR.glob("*.json"):
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            continue
+        entries.append((stat.st_mtime, stat.st_size, path))
+
+    total = sum(size for _, size, _ in entries)
+    removed = 0
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        path.unlink(missing_ok=True)
+        total -= size
+        removed += 1
+    return removed
+
+
+def clear() -> None:
+    """Remove every cached completion."""
+    if CACHE_DIR.exists():
+        for path in CACHE_DIR.glob("*.json"):
+            path.unlink(missing_ok=True)
@@ -11,11 +11,15 @@ you won't see "Van Gogh" twice until you've cycled through all 226+ bases.
 import json
 import os
 import secrets
+import threading
 from collections import deque
 from pathlib import Path
 
 QUEUE_FILE = Path(__file__).parent / "randomish_queue.json"
 
+# Backfills pick styles from several threads; the queue file is read-modify-write
+_queue_lock = threading.Lock()
+
 
 def _shuffle(items: list) -> list:
     """Cryptographically random shuffle using secrets module."""
@@ -58,13 +62,14 @@ def get_random_style(style_bases: list, style_phrases: list) -> str:
     Returns:
         A style string like "Van Gogh, bold colors, emotional resonance"
     """
-    queue = _load_queue(style_bases)
-    
-    if not queue:
-        queue = deque(_shuffle(style_bases))
-    
-    base = queue.popleft()
-    _save_queue(queue)
+    with _queue_lock:
+        queue = _load_queue(style_bases)
+
+        if not queue:
+            queue = deque(_shuffle(style_bases))
+
+        base = queue.popleft()
+        _save_queue(queue)
     
     num_phrases = secrets.randbelow(2) + 2  # 2-3 phrases
     chosen = []
@@ -0,0 +1,72 @@
+"""
+Local record of what's on the web host, so unchanged files aren't uploaded again.
+
+promote.py uploads each file to a temporary name beside its destination,
+checks the remote copy's size and SHA-256 against the local file, and only then
+renames it into place (see promote._put). The file's hash is then recorded here
+under its remote path, in cache/remote_manifest.json. Uploading the same bytes
+to the same path again is skipped without a round trip to the host.
+
+This assumes nothing else writes those paths on the host; if something might
+have, `promote.py --force` uploads regardless and re-records what it sent.
+"""
+
+import hashlib
+import json
+import os
+import threading
+from pathlib import Path
+
+MANIFEST_PATH = Path(__file__).parent / "cache" / "remote_manifest.json"
+
+_lock = threading.Lock()
+
+
+def file_sha256(path: str) -> str:
+    with open(path, "rb") as f:
+        return hashlib.file_digest(f, "sha256").hexdigest()
+
+
+def _load(path: Path) -> dict:
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def _save(path: Path, manifest: dict) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f"{path.name}.{threading.get_ident()}.tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=4, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def unchanged(remote_path: str, sha256: str, size: int, path: Path | None = None) -> bool:
+    """True if the host was last sent exactly these bytes at `remote_path`."""
+    entry = _load(path or MANIFEST_PATH).get(remote_path)
+    return entry is not None and entry["sha256"] == sha256 and entry["size"] == size
+
+
+def record(remote_path: str, sha256: str, size: int, path: Path | None = None) -> None:
+    path = path or MANIFEST_PATH
+    with _lock:
+        manifest = _load(path)
+        manifest[remote_path] = {"sha256": sha256, "size": size}
+        _save(path, manifest)
+
+
+def move(renames: list, path: Path | None = None) -> None:
+    """Follow (src, dst) renames made on the host, such as promote.publish's."""
+    path = path or MANIFEST_PATH
+    with _lock:
+        manifest = _load(path)
+        for src, dst in renames:
+            entry = manifest.pop(src, None)
+            if entry is not None:
+                manifest[dst] = entry
+            else:
+                # Whatever is at `dst` now, it isn't what was recorded there
+                manifest.pop(dst, None)
+        _save(path, manifest)
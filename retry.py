@@ -0,0 +1,96 @@
+"""
+Staged retry engine for the generation pipeline.
+
+A failing stage is retried on its own, with exponential backoff and full jitter,
+as long as the failure looks transient (a timeout, a dropped connection, a 429
+or a 5xx). Anything else - usually the image model rejecting the prompt - moves
+the run one step down FALLBACK_STEPS, which trims the riskier bits of context
+until we land on Bob Ross. Context gathered at the start of the run is reused
+at every step, so a retry never re-fetches news or burns another style.
+"""
+
+import logging
+import random
+import time
+
+import requests
+
+import tracing
+
+logger = logging.getLogger(__name__)
+
+BOB_ROSS_STYLE = "Bob Ross, with peaceful happy little trees"
+
+# Applied in order on top of the run's own arguments. The first step is the
+# normal run; the second regenerates the prompt with everything unchanged.
+FALLBACK_STEPS = [
+    {},
+    {},
+    {"skip_news": True},
+    {"skip_calendar": True, "skip_news": True},
+    {
+        "skip_calendar": True,
+        "skip_holidays": True,
+        "skip_silly_days": True,
+        "skip_news": True,
+    },
+    {
+        "style": BOB_ROSS_STYLE,
+        "skip_calendar": True,
+        "skip_holidays": True,
+        "skip_silly_days": True,
+        "skip_news": True,
+    },
+]
+
+# Tries per stage (including the first) before the failure is handed back
+STAGE_ATTEMPTS = 3
+BACKOFF_BASE = 2.0  # seconds
+BACKOFF_CAP = 30.0  # seconds
+
+TRANSIENT_STATUS_CODES = {408, 425, 429, 500, 502, 503, 504}
+
+
+def is_transient(error: Exception) -> bool:
+    """True when sending the same request again has a fair chance of working."""
+    if isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout)):
+        return True
+
+    status_code = getattr(error, "status_code", None)
+    response = getattr(error, "response", None)
+    if status_code is None and response is not None:
+        status_code = getattr(response, "status_code", None)
+    return status_code in TRANSIENT_STATUS_CODES
+
+
+def backoff_delay(attempt: int, base: float = BACKOFF_BASE, cap: float = BACKOFF_CAP) -> float:
+    """Full-jitter backoff: a random wait between 0 and min(cap, base * 2**attempt)."""
+    return random.uniform(0, min(cap, base * 2**attempt))
+
+
+def retry_call(func, *args, label: str = "Call", attempts: int = STAGE_ATTEMPTS, sleep=time.sleep, **kwargs):
+    """
+    Call `func(*args, **kwargs)`, retrying transient failures with backoff.
+
+    A permanent failure, or the last transient one, is raised to the caller.
+    """
+    for attempt in range(attempts):
+        try:
+            return func(*args, **kwargs)
+        except Exception as e:
+            if attempt == attempts - 1 or not is_transient(e):
+                raise
+            delay = backoff_delay(attempt)
+            tracing.annotate(retries=attempt + 1)
+            logger.warning(f"{label} failed ({e}); retrying in {delay:.1f} seconds [{attempt + 1}/{attempts - 1}]")
+            sleep(delay)
+
+
+def describe_step(changes: dict) -> str:
+    """Human-readable summary of a fallback step for the logs."""
+    if not changes:
+        return "fresh prompt, same context"
+    parts = [key.replace("skip_", "no ") for key, value in changes.items() if key.startswith("skip_") and value]
+    if "style" in changes:
+        parts.append(f"style: {changes['style']}")
+    return ", ".join(parts)
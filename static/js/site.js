@@ -84,6 +84,45 @@ function extractDateFromUrl() {
   currentDate = new Date(year, month - 1, day);
 }
 
+// Function to pick the smallest image size that still fills the screen at its pixel density
+function pickImageUrl(dateString, orientation, imageInfo) {
+  const fullUrl = `${baseImageUrl}${dateString}-${orientation}.webp`;
+  // Older days only have the full-size image
+  if (!imageInfo || !imageInfo.variants || !imageInfo.width || !imageInfo.height) return fullUrl;
+
+  // .bg-image is drawn with background-size: contain, so it's scaled to fit inside the viewport
+  const drawnWidth = Math.min(window.innerWidth, window.innerHeight * imageInfo.width / imageInfo.height);
+  const neededWidth = Math.ceil(drawnWidth * (window.devicePixelRatio || 1));
+  const variant = [...imageInfo.variants].sort((a, b) => a - b).find(width => width >= neededWidth);
+  return variant ? `${baseImageUrl}${dateString}-${orientation}-${variant}w.webp` : fullUrl;
+}
+
+// Counts background changes, so a slow download can't replace a newer day's image
+let backgroundRequest = 0;
+
+// Function to paint the tiny placeholder right away and swap in the image once it has downloaded
+function setBackground(imageUrl, placeholder) {
+  const bgImage = document.querySelector('.bg-image');
+  const request = ++backgroundRequest;
+  const image = new Image();
+  image.src = imageUrl;
+
+  // Already downloaded (or no placeholder to show): no need for the blur-up
+  if (!placeholder || (image.complete && image.naturalWidth)) {
+    bgImage.classList.remove('placeholder');
+    bgImage.style.backgroundImage = `url('${imageUrl}')`;
+    return;
+  }
+
+  bgImage.style.backgroundImage = `url('${placeholder}')`;
+  bgImage.classList.add('placeholder');
+  image.onload = image.onerror = () => {
+    if (request !== backgroundRequest) return;
+    bgImage.style.backgroundImage = `url('${imageUrl}')`;
+    bgImage.classList.remove('placeholder');
+  };
+}
+
 async function loadPrompts(dateString, orientation) {
   const promptUrl = `/prompts/${dateString}-prompt.json`;
   try {
@@ -92,8 +131,10 @@ async function loadPrompts(dateString, orientation) {
       throw new Error(`HTTP error! Status: ${response.status}`);
     }
     const promptData = await response.json();
+    const imageInfo = (promptData["images"] || {})[orientation];
     return {
-      bgFile: `url('${baseImageUrl}${dateString}-${orientation}.webp')`,
+      imageUrl: pickImageUrl(dateString, orientation, imageInfo),
+      placeholder: imageInfo ? imageInfo.placeholder : null,
       text: promptData[orientation],
       holidays: promptData["holidays"],
       style: promptData["style"] || ''
@@ -221,7 +262,7 @@ async function updateImageTitleAndBackground() {
     const prompts = await loadPrompts(dateString, orientation);
     if (!prompts) return;
 
-    document.querySelector('.bg-image').style.backgroundImage = prompts.bgFile;
+    setBackground(prompts.imageUrl, prompts.placeholder);
     document.getElementById('modalDate').textContent = formatToLongDate(currentDate);
     document.getElementById('modalText').textContent = prompts.text;
     document.getElementById('modalHolidays').textContent = prompts.holidays;
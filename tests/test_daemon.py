@@ -0,0 +1,48 @@
+import datetime
+import time
+
+import clock
+import daemon
+
+
+class RecordingStop:
+    """A stop event that records each wait and stops the loop after the first one."""
+
+    def __init__(self):
+        self.waits = []
+
+    def is_set(self):
+        return bool(self.waits)
+
+    def wait(self, seconds):
+        self.waits.append(seconds)
+
+
+def test_failures_outside_the_catch_up_window_are_not_waited_for(tmp_path, monkeypatch):
+    now = clock.now()
+    today = now.date()
+    scheduler = daemon.Scheduler(datetime.time(0, 0), ahead_hours=0, catch_up_days=1, state_path=tmp_path / "state.json")
+    scheduler.state["since"] = (today - datetime.timedelta(days=30)).isoformat()
+    scheduler.state["completed"][today.isoformat()] = {"at": time.time(), "seconds": 1.0}
+    # Failed long enough ago that its retry time has passed, and too old to be caught up on
+    stale = (today - datetime.timedelta(days=5)).isoformat()
+    scheduler.state["failed"][stale] = {"at": time.time() - 10 * daemon.DAEMON_RETRY_INTERVAL, "attempts": 3}
+
+    assert scheduler.due_days(now) == []
+    assert scheduler.next_retry(now) is None
+
+    monkeypatch.setattr(daemon, "warm_up", lambda run_args: None)
+    stop = RecordingStop()
+    daemon.run_forever(scheduler, {}, stop)
+    assert stop.waits[0] >= daemon.MIN_WAIT_SECONDS
+
+
+def test_failures_inside_the_window_are_retried_on_time(tmp_path):
+    now = clock.now()
+    scheduler = daemon.Scheduler(datetime.time(0, 0), ahead_hours=0, catch_up_days=3, state_path=tmp_path / "state.json")
+    yesterday = (now.date() - datetime.timedelta(days=1)).isoformat()
+    scheduler.state["since"] = yesterday
+    failed_at = time.time()
+    scheduler.state["failed"][yesterday] = {"at": failed_at, "attempts": 1}
+
+    assert scheduler.next_retry(now) == failed_at + daemon.DAEMON_RETRY_INTERVAL
@@ -0,0 +1,56 @@
+import json
+from zoneinfo import ZoneInfo
+
+import pytest
+
+import clock
+import event_store
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    # West of UTC, where midnight UTC falls on the previous local day
+    monkeypatch.setattr(clock, "TIMEZONE", ZoneInfo("America/Chicago"))
+    monkeypatch.setattr(event_store, "STORE_PATH", tmp_path / "events.sqlite3")
+    return tmp_path / "events.sqlite3"
+
+
+def all_day(event_id, date, end_date):
+    return {"id": event_id, "summary": event_id, "start": {"date": date}, "end": {"date": end_date}}
+
+
+def test_all_day_events_stay_on_their_own_local_day(store):
+    conn = event_store._connect()
+    with conn:
+        event_store._apply(
+            conn,
+            "cal",
+            [
+                all_day("All-day Jan 2", "2024-01-02", "2024-01-03"),
+                all_day("All-day Jan 3", "2024-01-03", "2024-01-04"),
+                {
+                    "id": "Late Jan 2",
+                    "start": {"dateTime": "2024-01-02T23:30:00-06:00"},
+                    "end": {"dateTime": "2024-01-03T00:30:00-06:00"},
+                },
+            ],
+        )
+    conn.close()
+
+    events = event_store.events_between(["cal"], *clock.day_bounds_utc("2024-01-02"))
+    assert [event["id"] for event in events] == ["All-day Jan 2", "Late Jan 2"]
+
+
+def test_all_day_events_stored_at_midnight_utc_are_reindexed(store):
+    event = all_day("All-day Jan 3", "2024-01-03", "2024-01-04")
+    conn = event_store.sqlite3.connect(store)
+    conn.executescript(event_store.SCHEMA)
+    with conn:
+        conn.execute(
+            "INSERT INTO events (calendar_id, event_id, start_utc, end_utc, data) VALUES (?, ?, ?, ?, ?)",
+            ("cal", event["id"], "2024-01-03T00:00:00.000000Z", "2024-01-04T00:00:00.000000Z", json.dumps(event)),
+        )
+    conn.close()
+
+    assert event_store.events_between(["cal"], *clock.day_bounds_utc("2024-01-02")) == []
+    assert event_store.events_between(["cal"], *clock.day_bounds_utc("2024-01-03")) == [event]
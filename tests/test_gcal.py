@@ -0,0 +1,170 @@
+import datetime
+import json
+import os
+import threading
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+import googleapiclient
+import pytest
+
+import gcal
+from constants import SCOPES
+
+BUNDLED_DISCOVERY = os.path.join(
+    os.path.dirname(googleapiclient.__file__), "discovery_cache", "documents", "calendar.v3.json"
+)
+
+
+class FakeGoogle:
+    """
+    The discovery, token, calendarList and events endpoints on localhost,
+    counting requests to each by path.
+    """
+
+    def __init__(self):
+        self.requests = Counter()
+        self.tokens_issued = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self.url = f"http://127.0.0.1:{self._server.server_port}"
+        with open(BUNDLED_DISCOVERY) as f:
+            discovery = json.load(f)
+        discovery["rootUrl"] = f"{self.url}/"
+        discovery["baseUrl"] = f"{self.url}/calendar/v3/"
+        self.discovery = discovery
+
+    def _respond(self, method: str, path: str) -> dict:
+        with self._lock:
+            self.requests[path] += 1
+            if method == "POST" and path == "/token":
+                self.tokens_issued += 1
+                return {"access_token": f"access-{self.tokens_issued}", "expires_in": 3600, "token_type": "Bearer"}
+        if path == "/discovery/calendar/v3":
+            return self.discovery
+        if path == "/calendar/v3/users/me/calendarList":
+            return {"items": [{"id": "primary"}]}
+        if path.startswith("/calendar/v3/calendars/"):
+            return {"items": [{"id": "standup", "summary": "Stand-up", "start": {"dateTime": "2024-01-02T09:00:00Z"}}]}
+        return {}
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _reply(self, method):
+                length = int(self.headers.get("Content-Length") or 0)
+                self.rfile.read(length)
+                data = json.dumps(fake._respond(method, urlparse(self.path).path)).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                self._reply("GET")
+
+            def do_POST(self):
+                self._reply("POST")
+
+        return Handler
+
+    def start(self):
+        threading.Thread(target=self._server.serve_forever, name="fake-google", daemon=True).start()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+@pytest.fixture
+def google(tmp_path, monkeypatch):
+    fake = FakeGoogle()
+    fake.start()
+    monkeypatch.setattr(gcal, "GOOGLE_DISCOVERY_URL", f"{fake.url}/discovery/{{api}}/{{apiVersion}}")
+    monkeypatch.setattr(gcal, "GOOGLE_TOKEN_URI", f"{fake.url}/token")
+    monkeypatch.setattr(gcal, "DISCOVERY_CACHE_DIR", tmp_path / "discovery")
+    monkeypatch.setattr(gcal, "TOKEN_PATH", str(tmp_path / "token.json"))
+    monkeypatch.setattr(gcal, "GOOGLE_CALENDAR_IDS", ["primary"])
+    monkeypatch.setattr(gcal, "GOOGLE_CALENDAR_SYNC", False)
+    # Each test starts without the process-wide manager and service
+    monkeypatch.setattr(gcal, "_credentials_manager", None)
+    monkeypatch.setattr(gcal, "_service", None)
+    monkeypatch.setattr(gcal, "_service_creds", None)
+    yield fake
+    fake.stop()
+
+
+def write_token(path, expires_in: float):
+    expiry = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(seconds=expires_in)
+    with open(path, "w") as f:
+        json.dump(
+            {
+                "token": "access-0",
+                "refresh_token": "refresh",
+                "client_id": "client",
+                "client_secret": "secret",
+                "scopes": SCOPES,
+                "expiry": expiry.strftime("%Y-%m-%dT%H:%M:%SZ"),
+            },
+            f,
+        )
+
+
+def test_credentials_are_refreshed_ahead_of_expiry_and_kept(google):
+    # Still valid as far as google-auth is concerned (it allows a few minutes), but inside the margin
+    write_token(gcal.TOKEN_PATH, expires_in=450)
+    manager = gcal.CredentialsManager(token_path=gcal.TOKEN_PATH, refresh_margin=600)
+
+    creds = manager.get()
+    assert creds.token == "access-1"
+    assert google.requests["/token"] == 1
+    with open(gcal.TOKEN_PATH) as f:
+        assert json.load(f)["token"] == "access-1"
+
+    # Good for another hour now, so neither the token file nor the endpoint is touched again
+    os.remove(gcal.TOKEN_PATH)
+    assert manager.get() is creds
+    assert google.requests["/token"] == 1
+
+
+def test_credentials_far_from_expiry_are_not_refreshed(google):
+    write_token(gcal.TOKEN_PATH, expires_in=3600)
+    manager = gcal.CredentialsManager(token_path=gcal.TOKEN_PATH, refresh_margin=300)
+
+    assert manager.get().token == "access-0"
+    assert google.requests["/token"] == 0
+
+
+def test_discovery_document_is_fetched_once(google):
+    write_token(gcal.TOKEN_PATH, expires_in=3600)
+    creds = gcal.CredentialsManager(token_path=gcal.TOKEN_PATH).get()
+
+    gcal.get_calendar_service(creds)
+    assert google.requests["/discovery/calendar/v3"] == 1
+    assert len(list(gcal.DISCOVERY_CACHE_DIR.glob("*.json"))) == 1
+
+    # A new process (no service in memory yet) reads it from the disk cache
+    gcal._service = None
+    gcal.get_calendar_service(creds)
+    assert google.requests["/discovery/calendar/v3"] == 1
+
+
+def test_service_is_reused_across_dates(google):
+    write_token(gcal.TOKEN_PATH, expires_in=3600)
+    gcal._credentials_manager = gcal.CredentialsManager(token_path=gcal.TOKEN_PATH)
+
+    first = gcal.fetch_calendar_entries("", "Watercolor", "2024-01-02")
+    service = gcal._service
+    second = gcal.fetch_calendar_entries("", "Watercolor", "2024-01-03")
+
+    assert "Stand-up" in first and "Stand-up" in second
+    assert gcal._service is service
+    assert google.requests["/discovery/calendar/v3"] == 1
+    assert google.requests["/token"] == 0
+    assert google.requests["/calendar/v3/calendars/primary/events"] == 2
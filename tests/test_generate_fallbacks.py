@@ -0,0 +1,29 @@
+import generate
+from checkpoint import Checkpoint
+from retry import FALLBACK_STEPS
+
+
+def test_exhausted_fallbacks_restart_from_the_first_step(tmp_path, monkeypatch):
+    prompt_levels = []
+
+    def fake_retry_call(func, prompt, *args, **kwargs):
+        prompt_levels.append(prompt)
+        return f"image prompt for {prompt}"
+
+    monkeypatch.setattr(generate, "apply_fallback", lambda context, changes: {"news": [], "level": changes})
+    monkeypatch.setattr(generate, "build_prompt", lambda date, style, context: (repr(context["level"]), date))
+    monkeypatch.setattr(generate, "retry_call", fake_retry_call)
+    monkeypatch.setattr(
+        generate, "generate_images", lambda prompt, style, model, completed, hedger, checkpoint: ({}, {"landscape": "refused"})
+    )
+
+    checkpoint = Checkpoint("2024-01-02", root=tmp_path)
+    args = ("2024-01-02", "Watercolor", "image-model", {})
+    assert generate.generate_with_fallbacks(*args, prompt_cache_enabled=False, checkpoint=checkpoint) is None
+    assert checkpoint.prompt_levels() == []
+
+    # A resumed retry walks every step again, rather than only the last one that just failed
+    prompt_levels.clear()
+    resumed = Checkpoint("2024-01-02", resume=True, root=tmp_path)
+    assert generate.generate_with_fallbacks(*args, prompt_cache_enabled=False, checkpoint=resumed) is None
+    assert len(prompt_levels) == len(FALLBACK_STEPS)
@@ -0,0 +1,56 @@
+import base64
+import io
+import os
+import tracemalloc
+
+import pytest
+from PIL import Image
+
+import imaging
+
+# A 2K portrait, as the image model returns it
+SIZE = (1536, 2752)
+
+
+@pytest.fixture(scope="module")
+def data_url():
+    # Noise doesn't compress, so the PNG (and its data URL) is as big as a real one gets
+    image = Image.frombytes("RGB", SIZE, os.urandom(SIZE[0] * SIZE[1] * 3))
+    buffer = io.BytesIO()
+    image.save(buffer, format="png", compress_level=0)
+    return "data:image/png;base64," + base64.b64encode(buffer.getvalue()).decode("ascii")
+
+
+def save_webp_eagerly(data_url: str, path: str) -> int:
+    """How generate.py decoded responses before imaging.py: split, b64decode, BytesIO, then Image.open."""
+    image = Image.open(io.BytesIO(base64.b64decode(data_url.split(",", 1)[1])))
+    image.save(path, format="webp")
+    return os.path.getsize(path)
+
+
+def traced_peak(func, *args) -> int:
+    tracemalloc.start()
+    try:
+        func(*args)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def test_save_webp_peaks_lower_than_decoding_eagerly(data_url, tmp_path):
+    eager_peak = traced_peak(save_webp_eagerly, data_url, tmp_path / "eager.webp")
+    streamed_peak = traced_peak(imaging.save_webp, data_url, str(tmp_path / "streamed.webp"))
+
+    # Both peak while Pillow's WebP encoder copies out the pixels. Only the eager
+    # path is still holding the whole decoded file (as BytesIO) by then.
+    file_size = len(base64.b64decode(data_url.split(",", 1)[1]))
+    saved = eager_peak - streamed_peak
+    assert saved > file_size * 0.9, f"{streamed_peak / 2**20:.1f} MiB vs {eager_peak / 2**20:.1f} MiB"
+    assert (tmp_path / "streamed.webp").read_bytes() == (tmp_path / "eager.webp").read_bytes()
+
+
+def test_open_data_url_holds_the_decoded_file_once(data_url):
+    file_size = len(base64.b64decode(data_url.split(",", 1)[1]))
+    peak = traced_peak(lambda: imaging.open_data_url(data_url).close())
+    # One buffer for the file plus a decode window, not a buffer regrown as chunks arrive
+    assert peak < file_size * 1.5, f"{peak / 2**20:.1f} MiB for a {file_size / 2**20:.1f} MiB file"
@@ -0,0 +1,41 @@
+import subprocess
+import sys
+from pathlib import Path
+
+REPO = Path(__file__).parent.parent
+
+# Loaded only by the runs that use them: calendar, news, image encoding and upload
+LAZY_MODULES = ["gnews", "googleapiclient", "google_auth_oauthlib", "PIL", "asyncssh", "promote"]
+
+# Cold `import generate` was about 300 ms once the above went lazy, and about 780 ms before
+IMPORT_BUDGET_MS = 600
+
+
+def import_times(module: str) -> dict:
+    """Cumulative microseconds for each module a fresh `import module` loads, from python -X importtime."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=REPO,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if cumulative.strip().isdigit():
+            times[name.strip()] = int(cumulative)
+    return times
+
+
+def test_generate_does_not_import_heavy_dependencies():
+    loaded = {name.split(".")[0] for name in import_times("generate")}
+    assert not loaded & set(LAZY_MODULES)
+
+
+def test_generate_imports_within_budget():
+    # Best of three, so one slow start on a busy machine doesn't fail it
+    milliseconds = min(import_times("generate")["generate"] for _ in range(3)) / 1000
+    assert milliseconds < IMPORT_BUDGET_MS, f"import generate took {milliseconds:.0f} ms"
@@ -0,0 +1,15 @@
+import tracing
+
+
+def span(start, seconds):
+    return {"ts": start * 1_000_000, "dur": seconds * 1_000_000}
+
+
+def test_wall_seconds_counts_overlapping_spans_once():
+    # Two concurrent uploads, then one after a gap
+    assert tracing.wall_seconds([span(0.5, 1.0), span(0.0, 1.0), span(3.0, 1.0)]) == 2.5
+
+
+def test_wall_seconds_of_nested_spans_is_the_outer_one():
+    assert tracing.wall_seconds([span(0.0, 4.0), span(1.0, 1.0)]) == 4.0
+    assert tracing.wall_seconds([]) == 0.0
@@ -0,0 +1,57 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import transport
+
+# How long the stand-in takes to answer, like an image request
+ANSWER_SECONDS = 3.0
+
+
+@pytest.fixture
+def slow_server(monkeypatch):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers["Content-Length"]))
+            time.sleep(ANSWER_SECONDS)
+            data = b'{"ok": true}'
+            try:
+                self.send_response(200)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setattr(transport, "OPENROUTER_BASE_URL", f"http://127.0.0.1:{server.server_port}")
+    # One pooled connection, so a cancelled request that held on to it would stall the next
+    monkeypatch.setattr(transport, "_session", None)
+    monkeypatch.setattr(transport, "_pool_size", 1)
+    yield
+    transport.get_session().close()
+    server.shutdown()
+    server.server_close()
+
+
+def test_cancel_frees_a_request_waiting_for_headers(slow_server):
+    cancel = threading.Event()
+    threading.Timer(0.2, cancel.set).start()
+
+    started = time.perf_counter()
+    with pytest.raises(transport.RequestCancelled):
+        transport.post_json("/chat/completions", {}, cancel=cancel)
+    assert time.perf_counter() - started < ANSWER_SECONDS / 2
+
+    # The only pooled connection is free again, so this one doesn't wait on the cancelled one
+    started = time.perf_counter()
+    assert transport.post_json("/chat/completions", {}, cancel=threading.Event()) == {"ok": True}
+    assert time.perf_counter() - started < ANSWER_SECONDS * 1.5
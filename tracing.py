@@ -0,0 +1,199 @@
+"""
+Per-stage tracing spans for generate.py and promote.py.
+
+A run records one span per stage (context sources, prompt, each orientation's
+image request, encoding, uploads) with attributes such as the model, aspect
+ratio, byte size and retry count. When it finishes, everything is written as
+Chrome trace-event JSON next to the staging output, ready to open in
+chrome://tracing or https://ui.perfetto.dev, where concurrent stages show up
+side by side on their own threads.
+
+The active trace and span live in context variables, so spans nest without
+being passed around. Threads don't inherit context on their own: hand work to
+a thread through `in_context(func)`. With no trace running, `span()` records
+nothing. TRACING=0 only skips writing the file: a run's spans are still
+collected, for its `on_finish` callback (the run ledger, see ledger.py).
+"""
+
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from constants import TRACING
+
+logger = logging.getLogger(__name__)
+
+_trace = contextvars.ContextVar("trace", default=None)
+_span = contextvars.ContextVar("span", default=None)
+
+
+class Trace:
+    """Spans collected for one run, in Chrome's trace-event format."""
+
+    def __init__(self):
+        self.pid = os.getpid()
+        self.started_at = time.time()
+        self.events = []
+        self._threads = {}
+        self._origin = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def _micros(self, seconds: float) -> float:
+        return round((seconds - self._origin) * 1_000_000, 1)
+
+    def add(self, name: str, start: float, end: float, attrs: dict) -> None:
+        thread = threading.current_thread()
+        with self._lock:
+            self._threads.setdefault(thread.ident, thread.name)
+            self.events.append(
+                {
+                    "name": name,
+                    "cat": name.split(".", 1)[0],
+                    "ph": "X",
+                    "ts": self._micros(start),
+                    "dur": round((end - start) * 1_000_000, 1),
+                    "pid": self.pid,
+                    "tid": thread.ident,
+                    "args": attrs,
+                }
+            )
+
+    def last(self, name: str) -> dict | None:
+        """The most recently finished span called `name` on this thread."""
+        tid = threading.current_thread().ident
+        with self._lock:
+            return next((e for e in reversed(self.events) if e["name"] == name and e["tid"] == tid), None)
+
+    def within(self, event: dict) -> list:
+        """Every span that ran inside `event`'s time window (itself included), on any thread."""
+        end = event["ts"] + event["dur"]
+        with self._lock:
+            return [e for e in self.events if event["ts"] <= e["ts"] and e["ts"] + e["dur"] <= end]
+
+    def write(self, path: str) -> None:
+        with self._lock:
+            thread_names = [
+                {"name": "thread_name", "ph": "M", "pid": self.pid, "tid": tid, "args": {"name": name}}
+                for tid, name in self._threads.items()
+            ]
+            trace = {"traceEvents": thread_names + self.events, "displayTimeUnit": "ms"}
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w") as f:
+            json.dump(trace, f, default=str)
+
+
+def wall_seconds(events: list) -> float:
+    """
+    Seconds during which at least one of `events` was running. Unlike adding up
+    their durations, spans that overlap (concurrent uploads) count once.
+    """
+    total = 0.0
+    covered_until = None
+    for event in sorted(events, key=lambda e: e["ts"]):
+        start, end = event["ts"], event["ts"] + event["dur"]
+        if covered_until is None or start > covered_until:
+            total += end - start
+            covered_until = end
+        elif end > covered_until:
+            total += end - covered_until
+            covered_until = end
+    return total / 1_000_000
+
+
+class Span:
+    def __init__(self, name: str, attrs: dict):
+        self.name = name
+        self.attrs = attrs
+
+    def set(self, **attrs) -> None:
+        """Add attributes that are only known once the stage is underway (a byte count, say)."""
+        self.attrs.update(attrs)
+
+
+@contextmanager
+def span(name: str, **attrs):
+    """Time the enclosed block as `name`; yields the Span so attributes can be added."""
+    current = Span(name, attrs)
+    trace = _trace.get()
+    if trace is None:
+        yield current
+        return
+
+    token = _span.set(current)
+    start = time.perf_counter()
+    try:
+        yield current
+    except BaseException as e:
+        current.attrs["error"] = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        _span.reset(token)
+        trace.add(name, start, time.perf_counter(), current.attrs)
+
+
+def annotate(**attrs) -> None:
+    """Add attributes to the innermost open span, if there is one."""
+    current = _span.get()
+    if current is not None:
+        current.set(**attrs)
+
+
+def _finish(on_finish, trace: Trace, name: str) -> None:
+    if on_finish is None:
+        return
+    event = trace.last(name)
+    if event is None:
+        return
+    try:
+        on_finish(trace, event)
+    except Exception as e:
+        logger.warning(f"Could not finish recording {name}: {e}")
+
+
+@contextmanager
+def run(name: str, path: str, on_finish=None, **attrs):
+    """
+    Trace a whole run as the span `name`, writing the trace to `path` at the end
+    (if TRACING is on), then calling `on_finish(trace, event)` with the run's
+    own span event.
+
+    Inside a run that's already being traced (promote.main called from
+    generate.main, say) this is just another span in that trace.
+    """
+    parent = _trace.get()
+    if parent is not None:
+        try:
+            with span(name, **attrs) as current:
+                yield current
+        finally:
+            _finish(on_finish, parent, name)
+        return
+
+    trace = Trace()
+    token = _trace.set(trace)
+    try:
+        with span(name, **attrs) as current:
+            yield current
+    finally:
+        _trace.reset(token)
+        if TRACING:
+            try:
+                trace.write(path)
+                logger.info(f"Wrote trace to {path}")
+            except OSError as e:
+                logger.warning(f"Could not write trace to {path}: {e}")
+        _finish(on_finish, trace, name)
+
+
+def in_context(func):
+    """Wrap `func` to run in a copy of the caller's context, for handing to another thread."""
+    context = contextvars.copy_context()
+
+    def wrapper(*args, **kwargs):
+        return context.run(func, *args, **kwargs)
+
+    return wrapper
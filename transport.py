@@ -0,0 +1,262 @@
+"""
+Shared HTTP transport for everything that talks to OpenRouter.
+
+One pooled, keep-alive `requests.Session` is created on first use and shared by
+the prompt and image calls (and by the threads that request both orientations
+at once), so only the first request to openrouter.ai pays for the TCP and TLS
+handshake. Pool size, timeouts and an optional requests-per-minute cap come
+from constants.py and can be overridden with `configure()`.
+
+A request made with a `cancel` event can be abandoned at any point, including
+while it waits for the response headers, which is where an image request spends
+nearly all of its time: setting the event shuts down the socket under it, so its
+pooled connection is freed at once instead of when the provider answers.
+"""
+
+import json
+import logging
+import socket
+import threading
+import time
+from collections import deque
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+from constants import (
+    HEDGE_MAX_EXTRA_REQUESTS,
+    OPENROUTER_AICALART_API_KEY,
+    OPENROUTER_BASE_URL,
+    OPENROUTER_CONNECT_TIMEOUT,
+    OPENROUTER_POOL_SIZE,
+    OPENROUTER_READ_TIMEOUT,
+    OPENROUTER_REQUESTS_PER_MINUTE,
+)
+
+logger = logging.getLogger(__name__)
+
+# Bytes read per step when streaming a response that may be cancelled
+CANCEL_CHUNK_BYTES = 256 * 1024
+
+# How often a cancellable request's watcher checks whether the request has finished
+CANCEL_POLL_SECONDS = 0.25
+
+_session = None
+_session_lock = threading.Lock()
+# A run has both orientations in flight, plus any hedged duplicates (see hedge.py)
+_pool_size = max(OPENROUTER_POOL_SIZE, 2 + HEDGE_MAX_EXTRA_REQUESTS)
+
+# Per thread: called with each connection a cancellable request takes from the pool
+_on_connection = threading.local()
+
+
+class RequestCancelled(Exception):
+    """A request abandoned through its `cancel` event."""
+
+
+class RateLimiter:
+    """Sliding one-minute window shared by every thread; `acquire()` blocks for a free slot."""
+
+    def __init__(self, requests_per_minute: int):
+        self.requests_per_minute = requests_per_minute
+        self._sent = deque()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        if self.requests_per_minute <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                while self._sent and now - self._sent[0] >= 60:
+                    self._sent.popleft()
+                if len(self._sent) < self.requests_per_minute:
+                    self._sent.append(now)
+                    return
+                wait = 60 - (now - self._sent[0])
+            time.sleep(wait)
+
+
+_rate_limiter = RateLimiter(OPENROUTER_REQUESTS_PER_MINUTE)
+
+
+class _TrackingPoolMixin:
+    def _get_conn(self, timeout=None):
+        conn = super()._get_conn(timeout)
+        callback = getattr(_on_connection, "callback", None)
+        if callback is not None:
+            callback(conn)
+        return conn
+
+
+class _TrackingHTTPConnectionPool(_TrackingPoolMixin, HTTPConnectionPool):
+    pass
+
+
+class _TrackingHTTPSConnectionPool(_TrackingPoolMixin, HTTPSConnectionPool):
+    pass
+
+
+class _TrackingAdapter(HTTPAdapter):
+    """An HTTPAdapter whose pools report the connection each request takes, so it can be cut off."""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _TrackingHTTPConnectionPool,
+            "https": _TrackingHTTPSConnectionPool,
+        }
+
+
+def _build_session(pool_size: int) -> requests.Session:
+    session = requests.Session()
+    adapter = _TrackingAdapter(pool_connections=1, pool_maxsize=pool_size, pool_block=True)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers.update(
+        {
+            "Authorization": f"Bearer {OPENROUTER_AICALART_API_KEY}",
+            "Content-Type": "application/json",
+        }
+    )
+    return session
+
+
+def get_session() -> requests.Session:
+    """Return the process-wide OpenRouter session, creating it on first use."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = _build_session(_pool_size)
+    return _session
+
+
+def configure(pool_size: int | None = None, requests_per_minute: int | None = None) -> None:
+    """
+    Override the pool size and/or rate cap from constants.py.
+
+    Call before the first request; a session that already exists is closed and
+    rebuilt with the new pool size.
+    """
+    global _session, _pool_size, _rate_limiter
+    with _session_lock:
+        if pool_size is not None and pool_size != _pool_size:
+            _pool_size = pool_size
+            if _session is not None:
+                _session.close()
+                _session = None
+    if requests_per_minute is not None:
+        _rate_limiter = RateLimiter(requests_per_minute)
+
+
+def post_json(
+    path: str,
+    payload: dict,
+    timeout: tuple | float | None = None,
+    cancel: threading.Event | None = None,
+) -> dict:
+    """
+    POST `payload` to `OPENROUTER_BASE_URL + path` over the shared session.
+
+    With a `cancel` event, setting the event abandons the request wherever it
+    is (sending, waiting for the headers or reading the body) by shutting down
+    its socket, and it raises RequestCancelled. That frees the connection at
+    once, but the upstream work is already paid for.
+
+    Raises `requests.exceptions.HTTPError` for non-2xx responses.
+    """
+    _rate_limiter.acquire()
+    if cancel is None:
+        response = get_session().post(
+            url=f"{OPENROUTER_BASE_URL}{path}",
+            json=payload,
+            timeout=timeout or (OPENROUTER_CONNECT_TIMEOUT, OPENROUTER_READ_TIMEOUT),
+        )
+        response.raise_for_status()
+        return response.json()
+
+    if cancel.is_set():
+        raise RequestCancelled(path)
+    connections = []
+    done = threading.Event()
+    watcher = threading.Thread(
+        target=_cut_off_when_cancelled, args=(cancel, done, connections), name="cancel-watch", daemon=True
+    )
+    _on_connection.callback = connections.append
+    watcher.start()
+    try:
+        response = get_session().post(
+            url=f"{OPENROUTER_BASE_URL}{path}",
+            json=payload,
+            timeout=timeout or (OPENROUTER_CONNECT_TIMEOUT, OPENROUTER_READ_TIMEOUT),
+            stream=True,
+        )
+        try:
+            response.raise_for_status()
+            chunks = []
+            for chunk in response.iter_content(CANCEL_CHUNK_BYTES):
+                if cancel.is_set():
+                    raise RequestCancelled(path)
+                chunks.append(chunk)
+        finally:
+            response.close()
+    except requests.exceptions.RequestException:
+        # The watcher shutting the socket down surfaces as a connection error
+        if cancel.is_set():
+            raise RequestCancelled(path)
+        raise
+    finally:
+        _on_connection.callback = None
+        done.set()
+    body = b"".join(chunks)
+    del chunks
+    return json.loads(body)
+
+
+def _cut_off_when_cancelled(cancel: threading.Event, done: threading.Event, connections: list) -> None:
+    """Shut down the sockets under a request once `cancel` is set, unless it finishes first."""
+    while not cancel.wait(CANCEL_POLL_SECONDS):
+        if done.is_set():
+            return
+    # Until the request has a connected socket (it may still be connecting), keep trying
+    while not done.is_set():
+        sockets = [conn.sock for conn in connections if getattr(conn, "sock", None) is not None]
+        for sock in sockets:
+            try:
+                # Wakes the request's blocked read; urllib3 then discards the connection
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        if sockets:
+            return
+        done.wait(CANCEL_POLL_SECONDS)
+
+
+def connection_stats() -> dict:
+    """Requests sent and connections opened by the shared session so far."""
+    stats = {"requests": 0, "connections": 0}
+    if _session is None:
+        return stats
+
+    for adapter in set(_session.adapters.values()):
+        pools = adapter.poolmanager.pools
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            stats["requests"] += pool.num_requests
+            stats["connections"] += pool.num_connections
+    stats["reused"] = max(stats["requests"] - stats["connections"], 0)
+    return stats
+
+
+def log_connection_stats() -> None:
+    stats = connection_stats()
+    if not stats["requests"]:
+        return
+    logger.info(
+        f"OpenRouter transport: {stats['requests']} requests over "
+        f"{stats['connections']} connection(s), {stats['reused']} reused"
+    )